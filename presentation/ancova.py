@@ -0,0 +1,99 @@
+# ancova.py
+"""
+ANCOVA of every imputation and visit as one multi-right-hand-side problem.
+
+ANCOVA.R fits a separate lm for every imputation within every visit
+(28 x 100 fits) and then runs emmeans. The design (treatment, baseline and
+the other covariates) is the same for all of them, only CHG changes. So the
+design is factored once with a QR decomposition and all responses are
+solved together: the (n, M * V) response matrix needs a single GEMM.
+"""
+import numpy as np
+from scipy.linalg import solve_triangular
+
+from instrument import timed
+from monotone import CLASS_COLS, design_matrix
+
+ANCOVA_COVARIATES = ("TRT01PN", "BASE", "BLBMIG1N", "REGIONN")
+
+
+@timed("ancova")
+def ancova(cube, visits, covariates=ANCOVA_COVARIATES, trt="TRT01PN", ref=2, classes=CLASS_COLS):
+    """
+    Fits CHG ~ covariates for every imputation and visit of the cube and
+    derives the treatment LS means (proportional weights, as with
+    weights = "proportional" in emmeans and OBSMARGINS in PROC MIXED) and
+    the treatment-vs-control contrasts.
+
+    Args:
+        cube: Completed ImputationCube (no missing visit values).
+        visits: Names of the visit columns to analyse.
+        covariates: Model covariates; must include trt.
+        trt: Treatment variable.
+        ref: Control level of the treatment variable.
+        classes: Which covariates are class variables.
+
+    Returns:
+        A dictionary with
+            'visits', 'levels' (treatment levels), 'arms' (the non-control
+            levels, one per contrast),
+            'lsmean', 'lsmean_se': arrays of shape (M, V, levels),
+            'estimate', 'se': contrasts of shape (M, V, arms),
+            'df': residual degrees of freedom of every fit, shape (M, V);
+                  all fits share the design, so the values are equal,
+            'coef': coefficients of shape (M, V, q) and 'names'.
+    """
+    columns = cube.columns
+    first = cube[0]
+    x, names = design_matrix(first, columns, covariates, classes, references={trt: ref})
+    n, q = x.shape
+
+    # One factorization of the shared design
+    qmat, rmat = np.linalg.qr(x)
+    rinv = solve_triangular(rmat, np.eye(q))
+    xtx_inv = rinv @ rinv.T
+
+    vcols = [columns.index(v) for v in visits]
+    y = cube[:, :, vcols].astype(np.float64)          # (M, n, V)
+    nimpute, _, nvisit = y.shape
+    y = y.transpose(1, 0, 2).reshape(n, nimpute * nvisit)
+    if np.isnan(y).any():
+        raise ValueError("ANCOVA needs completed data; impute the missing visits first.")
+    qty = qmat.T @ y
+    coef = rinv @ qty
+    rss = np.einsum("ij,ij->j", y, y) - np.einsum("ij,ij->j", qty, qty)
+    sigma2 = rss / (n - q)
+
+    # LS means: average prediction with the treatment set to each level
+    levels = np.unique(first[:, columns.index(trt)])
+    trt_cols = [names.index(f"{trt}{level:g}") if level != ref else None for level in levels]
+    base_row = x.mean(axis=0)
+    lmat = np.tile(base_row, (len(levels), 1))
+    for i, col in enumerate(trt_cols):
+        for other in trt_cols:
+            if other is not None:
+                lmat[i, other] = 0.0
+        if col is not None:
+            lmat[i, col] = 1.0
+    ref_index = list(levels).index(ref)
+    cmat = np.delete(lmat - lmat[ref_index], ref_index, axis=0)
+
+    def _shape(values):
+        return values.reshape(values.shape[0], nimpute, nvisit).transpose(1, 2, 0)
+
+    lsmean = _shape(lmat @ coef)
+    lsmean_se = _shape(np.sqrt(np.einsum("ij,jk,ik->i", lmat, xtx_inv, lmat)[:, None] * sigma2))
+    estimate = _shape(cmat @ coef)
+    se = _shape(np.sqrt(np.einsum("ij,jk,ik->i", cmat, xtx_inv, cmat)[:, None] * sigma2))
+    return {
+        "visits": list(visits),
+        "levels": levels,
+        "arms": np.delete(levels, ref_index),
+        "lsmean": lsmean,
+        "lsmean_se": lsmean_se,
+        "estimate": estimate,
+        "se": se,
+        "df": np.full((nimpute, nvisit), n - q),
+        "coef": _shape(coef),
+        "names": names,
+    }
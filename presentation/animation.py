@@ -0,0 +1,215 @@
+# animation.py
+"""
+Animation of the two-step imputation process, rendered straight from arrays.
+
+The first version of 'fig/missing data flow.py' drew every cell with ax.text,
+saved each matplotlib figure to PNG and decoded it again, so the cost grew
+with cells x frames and the 500 x 28 study could not be animated. Here each
+frame is an array of cell states, colored through a palette lookup and
+scaled up with np.repeat. Frames are rendered in worker processes and
+handed to the writer one at a time as they finish, so only a few frames are
+held in memory. GIFs are written frame by frame with the block writers of
+Pillow's GifImagePlugin; for WebP and APNG, Image.save collects the frames
+into a list before encoding. Above max_rows subjects, rows are aggregated into bands whose
+color is the mean color of their cells.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import GifImagePlugin, Image, ImageDraw, ImageFont
+
+# Cell states
+OBSERVED, MISSING, MCMC, REGRESSION, CURRENT = range(5)
+
+PALETTE = np.array([
+    (235, 235, 235),    # observed
+    (25, 25, 25),       # missing
+    (230, 150, 40),     # imputed by MCMC (intermittent)
+    (70, 120, 200),     # imputed by monotone regression
+    (215, 40, 40),      # being imputed in this frame
+], dtype=np.float32)
+
+HEADER = 28
+BACKGROUND = (255, 255, 255)
+
+
+def imputation_frames(original, dropout, visits=None):
+    """
+    Cell states of every frame of the imputation process: the initial data,
+    the monotone pattern left by MCMC, one frame per visit imputed by
+    monotone regression and the completed data.
+
+    Args:
+        original: (n, V) visit values with NaN for missing values.
+        dropout: (n, V) bool, the missing values after each subject's last
+                 observed visit, which MCMC leaves for monotone regression.
+        visits: Optional names of the V visit columns, e.g. 'WEEK4', used in
+                the frame titles; 'Visit 1', 'Visit 2', ... when omitted.
+
+    Returns:
+        A tuple (codes, titles) with codes of shape (frames, n, V) (uint8
+        cell states) and one title per frame.
+    """
+    missing = np.isnan(original)
+    dropout = dropout & missing
+    col = np.arange(original.shape[1])
+    stages = np.concatenate([[-1], np.flatnonzero(dropout.any(axis=0)), [original.shape[1]]])
+
+    base = np.where(missing, MCMC, OBSERVED).astype(np.uint8)
+    stage = stages[:, None, None]
+    codes = np.where(dropout, np.where(col < stage, REGRESSION, np.where(col == stage, CURRENT, MISSING)), base)
+    codes = np.concatenate([np.where(missing, MISSING, OBSERVED)[None].astype(np.uint8), codes.astype(np.uint8)])
+
+    titles = ["1. Initial Non-Monotone Missing Data", "2. After MCMC Pre-processing (Monotone Pattern)"]
+    visits = [f"Visit {j + 1}" for j in col] if visits is None else list(visits)
+    titles += [f"3. Monotone Regression: Imputing {visits[j]}" for j in stages[1:-1]]
+    titles += ["4. Fully Imputed Dataset"]
+    return codes, titles
+
+
+def frame_colors(codes, values=None, max_rows=250, order=None):
+    """
+    RGB colors of every cell, with observed and imputed cells shaded by
+    their value. When there are more than max_rows rows, consecutive rows
+    are averaged into max_rows bands.
+
+    Args:
+        codes: (frames, n, V) cell states.
+        values: Optional (n, V) completed values used for shading.
+        max_rows: Largest number of rows drawn one by one.
+        order: Optional row order, e.g. rows sorted by dropout visit.
+
+    Returns:
+        A float32 array (frames, rows, V, 3).
+    """
+    if order is not None:
+        codes = codes[:, order]
+        values = None if values is None else values[order]
+    rgb = PALETTE[codes]
+    if values is not None:
+        lo, hi = np.nanmin(values), np.nanmax(values)
+        shade = 0.7 + 0.3 * (np.nan_to_num(values, nan=lo) - lo) / max(hi - lo, 1e-12)
+        rgb *= np.where(codes == MISSING, 1.0, shade[None])[..., None]
+
+    n = rgb.shape[1]
+    if n > max_rows:
+        starts = (np.arange(max_rows) * n) // max_rows
+        counts = np.diff(np.append(starts, n))
+        rgb = np.add.reduceat(rgb, starts, axis=1) / counts[None, :, None, None]
+    return rgb
+
+
+def _font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_frame(rgb, title, cell=(3, 24), mode="RGB"):
+    """
+    Rasterizes one frame of frame_colors: each cell becomes a block of
+    cell = (height, width) pixels, with one-pixel gaps between visit
+    columns, under a header with the title.
+    """
+    h, w = cell
+    pixels = np.repeat(np.repeat(rgb, h, axis=0), w, axis=1)
+    if w > 3:
+        pixels[:, w - 1::w] = BACKGROUND
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+
+    image = Image.new("RGB", (pixels.shape[1], pixels.shape[0] + HEADER), BACKGROUND)
+    image.paste(Image.fromarray(pixels), (0, HEADER))
+    ImageDraw.Draw(image).text((4, 4), title, fill=(0, 0, 0), font=_font(HEADER - 10))
+    if mode == "P":
+        image = image.quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    return image
+
+
+def _render(args):
+    return render_frame(*args)
+
+
+def render_frames(rgb, titles, cell=(3, 24), mode="RGB", workers=None):
+    """
+    Renders the frames lazily, in parallel worker processes when workers > 1.
+    At most two frames per worker are in flight, so a slow writer does not
+    let finished frames pile up.
+
+    Returns:
+        A generator of PIL images, in frame order.
+    """
+    tasks = [(frame, title, cell, mode) for frame, title in zip(rgb, titles)]
+    workers = workers or min(os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        yield from map(_render, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_render, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _write_gif(frames, path, duration, loop):
+    """
+    Writes a GIF one frame at a time: the header with the NETSCAPE2.0 loop
+    extension, then each frame with its own color table, then the trailer.
+    """
+    with open(path, "wb") as f:
+        for i, frame in enumerate(frames):
+            if i == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": loop, "duration": duration})
+                f.writelines(header)
+            f.writelines(GifImagePlugin.getdata(frame, duration=duration, include_color_table=True))
+        f.write(b";")
+
+
+def save_animation(frames, path, duration=1500, loop=0):
+    """
+    Writes the frames as an animated GIF, WebP or APNG, chosen by the file
+    extension of path. A GIF is written as each frame comes out of the
+    iterable; Pillow's WebP and APNG writers collect all frames first.
+    duration is the display time per frame in ms. GIF frames must be in
+    mode 'P'.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    options = {"gif": None, "webp": {"lossless": True}, "png": {}}.get(ext.lstrip("."), False)
+    if options is False:
+        raise ValueError(f"Unsupported animation format: {ext}")
+    frames = iter(frames)
+    if options is None:
+        _write_gif(frames, path, duration, loop)
+        return path
+    first = next(frames)
+    first.save(path, save_all=True, append_images=frames, duration=duration, loop=loop, **options)
+    return path
+
+
+def animate(original, dropout, values, path, visits=None, max_rows=250, cell=(3, 24), duration=1500,
+            workers=None):
+    """
+    Builds the imputation-process animation of a study and writes it to path.
+    Rows are ordered by dropout visit so the monotone pattern is visible.
+
+    Args:
+        original: (n, V) visit values with NaN for missing values.
+        dropout: (n, V) bool, missing values left for monotone regression.
+        values: (n, V) completed values, used for shading.
+        path: Output file (.gif, .webp or .png).
+        visits: Optional names of the visit columns, used in the titles.
+        max_rows: Rows above which subjects are aggregated into bands.
+        cell: Pixel size (height, width) of one cell.
+        duration: Display time per frame in ms.
+        workers: Number of rendering processes.
+    """
+    codes, titles = imputation_frames(original, dropout, visits)
+    order = np.argsort(dropout.sum(axis=1), kind="stable")
+    rgb = frame_colors(codes, values, max_rows=max_rows, order=order)
+    mode = "P" if path.lower().endswith(".gif") else "RGB"
+    return save_animation(render_frames(rgb, titles, cell, mode, workers), path, duration)
@@ -0,0 +1,177 @@
+# appcache.py
+"""
+Caching layer of the presentation app.
+
+Streamlit reruns a page script from the top on every widget change. Here the
+expensive parts are memoized so a rerun only redraws:
+- process-wide resources shared by all sessions (st.cache_resource): the
+  loaded data, the EM estimate and the imputed cube;
+- per-parameter results (st.cache_data) with max_entries, so old parameter
+  combinations are evicted least-recently-used first;
+- CSS and images, read once per file version.
+Every cached function takes the content digest of its input file as an
+argument, so a changed file gives a new cache key and stale entries age out.
+"""
+import os
+import time
+
+import numpy as np
+import streamlit as st
+
+from ancova import ancova
+from datacache import file_digest
+from dataset import DATA_DIR, analysis_matrix, load_wide_data, visit_columns
+from mcmc import adaptive_burnin, em_norm, get_param, mda_norm, prelim_norm
+from metrics import gold_standard, imputation_metrics
+from pipeline import two_step_impute
+from pooling import edf_sweep
+
+DUMMY_PATH = os.path.join(DATA_DIR, "dummy.xpt")
+GOLD_PATH = os.path.join(DATA_DIR, "data_complete.csv")
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _asset(path, digest):
+    """
+    File content for st.image and st.markdown: text for CSS and SVG files,
+    bytes otherwise.
+    """
+    if os.path.splitext(path)[1].lower() in (".css", ".svg"):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def inject_css(path="style.css"):
+    """
+    Injects the style sheet of the app, read once per version of the file.
+    """
+    st.markdown(f"<style>\n{_asset(path, file_digest(path))}\n</style>", unsafe_allow_html=True)
+
+
+def image(path, **kwargs):
+    """
+    st.image from the asset cache, so figures are not re-read on every rerun.
+    """
+    st.image(_asset(path, file_digest(path)), **kwargs)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def wide_data(path=DUMMY_PATH, digest=None):
+    """
+    The wide dataset with its analysis matrix, as (wide, x, columns).
+    """
+    wide = load_wide_data(path)
+    x, columns = analysis_matrix(wide)
+    return wide, x, columns
+
+
+@st.cache_resource(max_entries=4, show_spinner="Running the EM algorithm...")
+def norm_estimate(path=DUMMY_PATH, digest=None, maxits=200):
+    """
+    The prelim_norm summary and EM estimate of the data, as (s, thetahat).
+    """
+    _, x, _ = wide_data(path, digest)
+    s = prelim_norm(x)
+    return s, em_norm(s, maxits=maxits)
+
+
+@st.cache_data(max_entries=32, show_spinner="Running MCMC...")
+def mcmc_draw(steps, seed, path=DUMMY_PATH, digest=None):
+    """
+    Posterior draw of the means after the given number of MCMC steps.
+
+    Returns:
+        A dictionary with 'mu' (original scale), 'npatt' and 'elapsed' (run
+        time in seconds of EM and MCMC when the result was computed).
+    """
+    start = time.perf_counter()
+    s, thetahat = norm_estimate(path, digest)
+    theta = mda_norm(s, thetahat, steps=steps, rng=seed)
+    mu, _ = get_param(s, theta)
+    return {"mu": mu, "npatt": s["npatt"], "elapsed": time.perf_counter() - start}
+
+
+@st.cache_data(max_entries=16, show_spinner="Running the chains until convergence...")
+def burnin_diagnostics(nchains=4, seed=13141, rhat_max=1.01, min_ess=400, path=DUMMY_PATH, digest=None):
+    """
+    adaptive_burnin on the dummy data.
+
+    Returns:
+        A dictionary with 'names', 'nbiter', 'converged', 'elapsed', 'trace'
+        (array of shape (chains, iterations, K)) and 'checks' (iteration,
+        R-hat and ESS of every convergence check).
+    """
+    start = time.perf_counter()
+    _, _, columns = wide_data(path, digest)
+    s, thetahat = norm_estimate(path, digest)
+    result = adaptive_burnin(s, thetahat, nchains, seed, columns, rhat_max=rhat_max, min_ess=min_ess, workers=None)
+    checks = result["checks"]
+    return {
+        "names": result["monitor"].names,
+        "nbiter": result["nbiter"],
+        "converged": result["converged"],
+        "elapsed": time.perf_counter() - start,
+        "trace": result["monitor"].trace(),
+        "checks": {
+            "iteration": np.array([c["niter"] for c in checks]),
+            "rhat": np.array([c["rhat"] for c in checks]),
+            "ess": np.array([c["ess"] for c in checks]),
+        },
+    }
+
+
+@st.cache_resource(max_entries=2, show_spinner="Running MCMC and monotone regression on the dummy data...")
+def imputed_cube(nimpute=100, path=DUMMY_PATH, digest=None):
+    """
+    Completed ImputationCube of the two-step workflow, shared by all sessions.
+    """
+    _, x, columns = wide_data(path, digest)
+    return two_step_impute(x, columns, nimpute=nimpute)
+
+
+@st.cache_data(max_entries=8, show_spinner="Running ANCOVA on every imputation...")
+def mi_ancova(nimpute=100, path=DUMMY_PATH, digest=None):
+    """
+    Per-imputation contrasts of the treatment vs. placebo for every visit,
+    as (visits, estimate, se, df) with the residual df of the model, which
+    is the same for every fit.
+    """
+    wide, _, _ = wide_data(path, digest)
+    fits = ancova(imputed_cube(nimpute, path, digest), visit_columns(wide))
+    return fits["visits"], fits["estimate"], fits["se"], int(fits["df"][0, 0])
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def edf_sensitivity(nimpute=100, path=DUMMY_PATH, digest=None, npoints=300):
+    """
+    Rubin's rule pooling of mi_ancova over a grid of EDF values: npoints
+    log-spaced values from 10 to 10000, the ANCOVA residual df and infinity.
+
+    Returns:
+        A tuple (grid, sweep) with the sorted EDF values and the edf_sweep
+        arrays of shape (len(grid), visits, contrasts).
+    """
+    _, estimates, std_errors, model_df = mi_ancova(nimpute, path, digest)
+    grid = np.union1d(np.round(np.geomspace(10, 10000, npoints)), [model_df, np.inf])
+    return grid, edf_sweep(estimates, std_errors ** 2, grid)
+
+
+@st.cache_data(max_entries=8, show_spinner="Comparing the imputations with the complete data...")
+def imputation_accuracy(nimpute=100, path=DUMMY_PATH, digest=None, gold_path=GOLD_PATH, gold_digest=None):
+    """
+    imputation_metrics of the imputed cube against the complete data.
+    """
+    wide, x, columns = wide_data(path, digest)
+    visits = visit_columns(wide)
+    truth = gold_standard(wide["SUBJID"], visits, gold_path)
+    mask = np.isnan(x[:, [columns.index(v) for v in visits]])
+    return imputation_metrics(imputed_cube(nimpute, path, digest), truth, mask, visits)
+
+
+def input_digest(path=DUMMY_PATH):
+    """
+    Content digest of an input file, used as the cache key of its results.
+    """
+    return file_digest(path)
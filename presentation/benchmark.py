@@ -0,0 +1,263 @@
+# benchmark.py
+"""
+Stage-level benchmarks of the imputation -> ANCOVA -> pooling pipeline.
+
+Every grid point (subjects, visits, imputations, missingness rate) runs in a
+fresh worker process on data from simulate_trial and times each stage:
+pattern preparation (prelim_norm), EM (em_norm), MCMC (mda_norm and the
+imputations), monotone regression, ANCOVA and pooling. For each stage the
+wall time, throughput (data cells per second) and peak RSS are recorded.
+Results are written to a versioned JSON file (under '.cache/benchmarks' by
+default, like the other generated files) and can be compared with a saved
+baseline to flag regressions.
+
+    python benchmark.py --grid quick
+    python benchmark.py --grid full --baseline baseline.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cube import cube_nbytes
+from dataset import COVARIATE_COLS, DATA_DIR
+
+SCHEMA_VERSION = 1
+BENCH_DIR = os.path.join(DATA_DIR, ".cache", "benchmarks")
+
+GRIDS = {
+    "quick": {"subjects": [500, 2000], "visits": [10, 28], "nimpute": [5, 20], "missing": [0.5]},
+    "full": {"subjects": [500, 5000, 50000], "visits": [10, 28, 150], "nimpute": [5, 100, 500],
+             "missing": [0.2, 0.5, 0.8]},
+}
+
+STAGES = ("prelim", "em", "mcmc", "monotone", "ancova", "pooling")
+
+# Grid points whose in-memory cube would exceed this are skipped
+MAX_CUBE_BYTES = 4 << 30
+
+
+def _reset_peak():
+    """
+    Resets the peak RSS of the process (Linux only).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_mb():
+    """
+    Peak RSS in MB since the last _reset_peak (since process start where the
+    reset is not supported).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_point(subjects, visits, nimpute, missing, emmaxits=200, maxits=100, seed=2025):
+    """
+    Benchmarks every stage on one generated dataset.
+
+    Args:
+        subjects, visits, nimpute: Size of the problem.
+        missing: Proportion of subjects with missing data (3:2 monotone vs.
+                 monotone plus intermittent, as in the dummy data).
+
+    Returns:
+        A list of records {'stage', 'seconds', 'cells_per_second',
+        'peak_rss_mb', 'iterations'} for the stages in STAGES, where
+        'iterations' counts the EM steps and MCMC iterations and is None
+        for the other stages.
+    """
+    from ancova import ancova
+    from instrument import RECORDER
+    from cube import create_cube
+    from mcmc import em_norm, imp_norm, mda_norm, prelim_norm
+    from monotone import monotone_reg
+    from pooling import rubin_pool
+    from simulate import simulate_trial, trial_matrix
+
+    week = np.arange(1, visits + 1) * 2
+    trial = simulate_trial(subjects, visits=week, seed=seed,
+                           pattern_mix=(1 - missing, 0.6 * missing, 0.4 * missing))
+    x, columns = trial_matrix(trial, visits=week)
+    rng = np.random.default_rng(seed)
+    cells = x.size
+    records = []
+
+    def timed(stage, func, work=cells):
+        _reset_peak()
+        counter = f"{stage}_iterations"
+        before = RECORDER.counters.get(counter, 0)
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        iterations = RECORDER.counters.get(counter, 0) - before if stage in ("em", "mcmc") else None
+        records.append({"stage": stage, "seconds": seconds, "cells_per_second": work / seconds,
+                        "peak_rss_mb": _peak_mb(), "iterations": iterations})
+        return result
+
+    s = timed("prelim", lambda: prelim_norm(x))
+    thetahat = timed("em", lambda: em_norm(s, maxits=emmaxits, cache_dir=None))
+
+    def mcmc():
+        theta = mda_norm(s, thetahat, steps=maxits, rng=rng)
+        cube = create_cube(nimpute, s["n"], s["p"], columns)
+        for i in range(nimpute):
+            cube.write(i, imp_norm(s, theta, rng))
+        cube.apply_mask(s["index"].dropout)
+        return cube
+
+    cube = timed("mcmc", mcmc, cells * nimpute)
+    timed("monotone", lambda: monotone_reg(cube, COVARIATE_COLS, seed=rng), cells * nimpute)
+    visit_names = columns[len(COVARIATE_COLS):]
+    fits = timed("ancova", lambda: ancova(cube, visit_names), cells * nimpute)
+    timed("pooling", lambda: rubin_pool(fits["estimate"], fits["se"] ** 2, edf=fits["df"][0][:, None]), nimpute * visits)
+    return records
+
+
+def _run(point):
+    return point, run_point(**point)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=DATA_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(grid="quick", repeat=1, workers=1, out=None, progress=None):
+    """
+    Runs all grid points and writes the results to a versioned JSON file.
+    Points whose imputation cube would not fit in MAX_CUBE_BYTES are skipped
+    and listed under 'skipped'.
+
+    Args:
+        grid: Name in GRIDS or a dictionary of lists with the keys
+              'subjects', 'visits', 'nimpute' and 'missing'.
+        repeat: Runs per grid point; the fastest run of each stage is kept.
+        workers: Parallel grid points. Use 1 for timings that are not
+                 disturbed by other benchmarks.
+        out: Output file; default '.cache/benchmarks/<time>_<commit>.json'.
+        progress: Optional callback progress(point, records).
+
+    Returns:
+        The benchmark report as a dictionary.
+    """
+    grid = GRIDS[grid] if isinstance(grid, str) else grid
+    points = [dict(zip(("subjects", "visits", "nimpute", "missing"), values))
+              for values in itertools.product(grid["subjects"], grid["visits"], grid["nimpute"], grid["missing"])]
+    # The covariates add 4 columns to the visits
+    skipped = [point for point in points
+               if cube_nbytes(point["nimpute"], point["subjects"], point["visits"] + 4) > MAX_CUBE_BYTES]
+    points = [point for point in points if point not in skipped]
+    best = {}
+    # A new process for every grid point so peak RSS is not inherited
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        for point, records in pool.map(_run, points * repeat):
+            for record in records:
+                key = (tuple(point.values()), record["stage"])
+                if key not in best or record["seconds"] < best[key]["seconds"]:
+                    best[key] = {**point, **record}
+            if progress is not None:
+                progress(point, records)
+
+    commit = _git_commit()
+    report = {
+        "schema": SCHEMA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "grid": grid,
+        "repeat": repeat,
+        "results": list(best.values()),
+        "skipped": skipped,
+    }
+    if out is None:
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        out = os.path.join(BENCH_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{commit}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=1)
+    report["path"] = out
+    return report
+
+
+def compare_reports(current, baseline, threshold=0.2, min_seconds=0.01):
+    """
+    Flags the stages that got slower than the baseline.
+
+    Args:
+        current, baseline: Reports (dictionaries or JSON file paths).
+        threshold: Relative slowdown that counts as a regression.
+        min_seconds: Stages faster than this in the baseline are ignored,
+                     their timings are mostly noise.
+
+    Returns:
+        A list of {'subjects', 'visits', 'nimpute', 'missing', 'stage',
+        'baseline', 'current', 'ratio'} for the regressions, worst first.
+    """
+    def load(report):
+        if isinstance(report, str):
+            with open(report) as f:
+                report = json.load(f)
+        if report.get("schema") != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported benchmark schema: {report.get('schema')}")
+        return {(r["subjects"], r["visits"], r["nimpute"], r["missing"], r["stage"]): r["seconds"]
+                for r in report["results"]}
+
+    now, before = load(current), load(baseline)
+    regressions = []
+    for key in now.keys() & before.keys():
+        if before[key] >= min_seconds and now[key] > before[key] * (1 + threshold):
+            regressions.append({**dict(zip(("subjects", "visits", "nimpute", "missing", "stage"), key)),
+                                "baseline": before[key], "current": now[key], "ratio": now[key] / before[key]})
+    return sorted(regressions, key=lambda r: -r["ratio"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages.")
+    parser.add_argument("--grid", default="quick", choices=list(GRIDS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", default=None, help="Output JSON file")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as regression")
+    args = parser.parse_args()
+
+    def show(point, records):
+        stages = ", ".join(f"{r['stage']} {r['seconds']:.3f}s" for r in records)
+        print(f"{point}: {stages}")
+
+    report = run_benchmarks(args.grid, args.repeat, args.workers, args.out, progress=show)
+    for point in report["skipped"]:
+        print(f"Skipped {point}: the cube would exceed {MAX_CUBE_BYTES >> 30} GB")
+    print(f"Results written to {report['path']}")
+    if args.baseline:
+        regressions = compare_reports(report, args.baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} at subjects={r['subjects']} visits={r['visits']} "
+                  f"nimpute={r['nimpute']} missing={r['missing']}: "
+                  f"{r['baseline']:.3f}s -> {r['current']:.3f}s ({r['ratio']:.2f}x)")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions.")
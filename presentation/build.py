@@ -0,0 +1,404 @@
+# build.py
+"""
+Incremental build of the figures in 'fig/' and 'plot/'.
+
+Every figure and intermediate analysis table is a Target with its input
+files, the parameters it uses and the function that builds it. A target's
+stamp is the hash of the content of its inputs, its parameter values, the
+source code of its action and of the project modules it imports (directly
+or through other modules), and the stamps of the targets it depends on. Only
+targets whose stamp changed (or whose outputs are missing) are rebuilt,
+independent ones in parallel worker processes. Intermediate tables (the
+imputed cube, the ANCOVA results) are kept under '.cache/build', so changing
+one plotting parameter only redraws that figure.
+
+    python build.py                   # rebuild whatever is stale
+    python build.py forest --force    # rebuild one target and what it needs
+    python build.py --set nimpute=50  # change a parameter
+"""
+import argparse
+import ast
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from datacache import file_digest, load_table
+from dataset import DATA_DIR
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+FIG_DIR = os.path.join(SRC_DIR, "fig")
+PLOT_DIR = os.path.join(DATA_DIR, "plot")
+BUILD_DIR = os.path.join(DATA_DIR, ".cache", "build")
+
+PARAMS = {
+    "nimpute": 100,
+    "mcmc_seed": 13141,
+    "reg_seed": 23424,
+    "dpi": 300,
+    "frame_ms": 1500,
+    "max_rows": 250,
+}
+
+MERMAID = {
+    "ANCOVA.mmd": "ANCOVA.svg",
+    "MCMC.mmd": "MCMC process.svg",
+    "Monotone.mmd": "Monotone regression.svg",
+    "Rubin.mmd": "Rubin's Rule.svg",
+    "generate_dummy.mmd": "generate_dummy.svg",
+}
+
+
+@dataclass
+class Target:
+    """
+    One node of the build graph.
+
+    Attributes:
+        name: Target name.
+        action: Module-level function called as action(target, params).
+        outputs: Files or directories the action writes.
+        inputs: Source files the action reads.
+        params: Names of the PARAMS entries the action uses.
+        deps: Names of the targets whose outputs the action reads.
+        tool: Optional external program the action runs; without it on
+              the PATH the target is skipped and its outputs are kept.
+    """
+    name: str
+    action: callable
+    outputs: list
+    inputs: list = field(default_factory=list)
+    params: list = field(default_factory=list)
+    deps: list = field(default_factory=list)
+    tool: str = None
+
+
+# --- Actions -------------------------------------------------------------------
+
+def build_imputation(target, params):
+    """
+    Two-step imputation of the dummy data into a file-backed cube.
+    """
+    from cube import create_cube
+    from dataset import analysis_matrix, load_wide_data
+    from pipeline import two_step_impute
+
+    path = target.outputs[0]
+    shutil.rmtree(path, ignore_errors=True)
+    x, columns = analysis_matrix(load_wide_data(target.inputs[0]))
+    cube = create_cube(params["nimpute"], x.shape[0], x.shape[1], columns, path=path)
+    two_step_impute(x, columns, nimpute=params["nimpute"], seed=params["mcmc_seed"], reg_seed=params["reg_seed"],
+                    out=cube)
+    cube.flush()
+
+
+def build_ancova(target, params):
+    """
+    ANCOVA of every imputation and visit, saved as an .npz table.
+    """
+    from ancova import ancova
+    from cube import open_cube
+    from dataset import VISIT_PREFIX
+
+    cube = open_cube(target_outputs("imputation")[0], mode="r")
+    visits = [c for c in cube.columns if c.startswith(VISIT_PREFIX)]
+    fits = ancova(cube, visits)
+    np.savez(target.outputs[0], visits=np.array(visits), estimate=fits["estimate"], se=fits["se"], df=fits["df"])
+
+
+def build_forest(target, params):
+    """
+    Forest plot of the pooled estimates and CIs of R, SAS and the Python
+    pipeline by visit, like plot/ANCOVA_forest.png of comparison.R.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    from pooling import rubin_pool
+
+    results = [load_table(path, columns=["AVISIT", "Estimate", "LCLMean", "UCLMean"]) for path in target.inputs]
+    with np.load(target_outputs("ancova")[0]) as fits:
+        # Pooled with the model df, as emmeans does in ANCOVA.R
+        pooled = rubin_pool(fits["estimate"], fits["se"] ** 2, edf=fits["df"][0][:, None])
+        results.append(pd.DataFrame({"AVISIT": fits["visits"], "Estimate": pooled["estimate"][:, 0],
+                                     "LCLMean": pooled["lower"][:, 0], "UCLMean": pooled["upper"][:, 0]}))
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+    for offset, res, (label, line, dot) in zip((-0.2, 0.0, 0.2), results, (
+            ("R", "#a6d8f0", "#008fd5"),
+            ("SAS", "#f9b282", "#de6b35"),
+            ("Python", "#b5dfb0", "#3a9b35"))):
+        week = res["AVISIT"].str.replace("WEEK", "").astype(int).to_numpy()
+        y = np.searchsorted(np.unique(week), week) + offset
+        ax.hlines(y, res["LCLMean"], res["UCLMean"], color=line, linewidth=2, label=label)
+        ax.scatter(res["Estimate"], y, s=20, color=dot, edgecolor="white", linewidth=0.5, zorder=3)
+    ax.set_yticks(np.arange(len(np.unique(week))), [f"WEEK{w}" for w in np.unique(week)], fontsize=5)
+    ax.set_xlabel("Estimate")
+    ax.set_ylabel("AVISIT")
+    ax.legend(title="source", frameon=False, loc="center left", bbox_to_anchor=(1.01, 0.5))
+    ax.spines[["top", "right"]].set_visible(False)
+    fig.tight_layout()
+    fig.savefig(target.outputs[0], dpi=params["dpi"])
+    plt.close(fig)
+
+
+def build_metrics(target, params):
+    """
+    MAE, MSE and MRAE of the imputations against the complete data.
+    """
+    from cube import open_cube
+    from dataset import analysis_matrix, load_wide_data, visit_columns
+    from metrics import gold_standard, imputation_metrics
+
+    wide = load_wide_data(target.inputs[0])
+    x, columns = analysis_matrix(wide)
+    visits = visit_columns(wide)
+    truth = gold_standard(wide["SUBJID"], visits, target.inputs[1])
+    mask = np.isnan(x[:, [columns.index(v) for v in visits]])
+    result = imputation_metrics(open_cube(target_outputs("imputation")[0], mode="r"), truth, mask, visits)
+    np.savez(target.outputs[0], visits=np.array(visits), **result)
+
+
+def build_metric_plot(target, params):
+    """
+    One accuracy metric by visit, as plot/MAE.png and plot/MSE.png of
+    comparison.R, for the Python imputations.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    metric = os.path.basename(target.outputs[0]).split("_")[0]
+    with np.load(target_outputs("metrics")[0]) as result:
+        week = [int(v[4:]) for v in result["visits"]]
+        values = result[metric.lower()]
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.plot(week, values, marker="o", linewidth=1, markersize=4, label="Python")
+    ax.set_xlabel("AVISIT")
+    ax.set_ylabel(metric)
+    ax.legend(title="Source", frameon=False, loc="center left", bbox_to_anchor=(1.01, 0.5))
+    ax.spines[["top", "right"]].set_visible(False)
+    fig.tight_layout()
+    fig.savefig(target.outputs[0], dpi=params["dpi"])
+    plt.close(fig)
+
+
+def build_animation(target, params):
+    """
+    The imputation-process animation from the dummy data and the first
+    imputation of the cube, next to the conceptual GIF of page 3.
+    """
+    from animation import animate
+    from cube import open_cube
+    from dataset import COVARIATE_COLS, analysis_matrix, load_wide_data
+    from patterns import build_pattern_index
+
+    x, columns = analysis_matrix(load_wide_data(target.inputs[0]))
+    visits = slice(len(COVARIATE_COLS), None)
+    dropout = build_pattern_index(x).dropout[:, visits]
+    values = open_cube(target_outputs("imputation")[0], mode="r")[0][:, visits].astype(np.float64)
+    animate(x[:, visits], dropout, values, target.outputs[0], visits=columns[visits],
+            max_rows=params["max_rows"], duration=params["frame_ms"])
+
+
+def build_mermaid(target, params):
+    """
+    Renders a Mermaid diagram with the Mermaid CLI (mmdc).
+    """
+    if shutil.which("mmdc") is None:
+        raise RuntimeError("The Mermaid CLI 'mmdc' is needed to render .mmd files (npm install -g @mermaid-js/mermaid-cli).")
+    subprocess.run(["mmdc", "-i", target.inputs[0], "-o", target.outputs[0]], check=True, capture_output=True)
+
+
+def _targets():
+    dummy = os.path.join(DATA_DIR, "dummy.xpt")
+    targets = [
+        Target("imputation", build_imputation, [os.path.join(BUILD_DIR, "cube")], [dummy],
+               ["nimpute", "mcmc_seed", "reg_seed"]),
+        Target("ancova", build_ancova, [os.path.join(BUILD_DIR, "ancova.npz")], deps=["imputation"]),
+        Target("metrics", build_metrics, [os.path.join(BUILD_DIR, "metrics.npz")],
+               [dummy, os.path.join(DATA_DIR, "data_complete.csv")], deps=["imputation"]),
+        Target("mae", build_metric_plot, [os.path.join(PLOT_DIR, "MAE_python.png")], params=["dpi"], deps=["metrics"]),
+        Target("mse", build_metric_plot, [os.path.join(PLOT_DIR, "MSE_python.png")], params=["dpi"], deps=["metrics"]),
+        Target("forest", build_forest, [os.path.join(PLOT_DIR, "ANCOVA_forest_python.png")],
+               [os.path.join(DATA_DIR, "diff_r1.xpt"), os.path.join(DATA_DIR, "SAS result", "diff_sas.sas7bdat")],
+               ["dpi"], ["ancova"]),
+        Target("animation", build_animation, [os.path.join(FIG_DIR, "missing_data_imputation_process_python.gif")],
+               [dummy], ["frame_ms", "max_rows"], ["imputation"]),
+    ]
+    for source, svg in MERMAID.items():
+        targets.append(Target(os.path.splitext(svg)[0], build_mermaid, [os.path.join(FIG_DIR, svg)],
+                              [os.path.join(FIG_DIR, source)], tool="mmdc"))
+    return {t.name: t for t in targets}
+
+
+TARGETS = _targets()
+
+
+def target_outputs(name):
+    return TARGETS[name].outputs
+
+
+# --- Scheduling ----------------------------------------------------------------
+
+def _imported_modules(nodes):
+    """
+    Names of the project modules (files in SRC_DIR) imported in the AST
+    nodes, including imports inside functions.
+    """
+    names = set()
+    for node in (n for top in nodes for n in ast.walk(top)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return {name for name in names if os.path.exists(os.path.join(SRC_DIR, f"{name}.py"))}
+
+
+def module_sources(func):
+    """
+    Source files of the project modules a function of this file uses: its
+    own imports and the module-level imports of build.py, followed
+    transitively through the imports of those modules, sorted.
+    """
+    with open(__file__, encoding="utf-8") as f:
+        module = ast.parse(f.read())
+    header = [node for node in module.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    todo = _imported_modules(header + [ast.parse(inspect.getsource(func).strip())])
+    seen = set()
+    while todo:
+        name = todo.pop()
+        seen.add(name)
+        with open(os.path.join(SRC_DIR, f"{name}.py"), encoding="utf-8") as f:
+            todo |= _imported_modules([ast.parse(f.read())]) - seen
+    return sorted(os.path.join(SRC_DIR, f"{name}.py") for name in seen)
+
+
+def stamp(target, params, stamps):
+    """
+    Hash of everything the target's outputs depend on.
+    """
+    sha = hashlib.sha256(inspect.getsource(target.action).encode("utf-8"))
+    for path in module_sources(target.action):
+        sha.update(file_digest(path).encode("utf-8"))
+    for path in target.inputs:
+        sha.update(file_digest(path).encode("utf-8"))
+    sha.update(json.dumps({k: params[k] for k in target.params}, sort_keys=True).encode("utf-8"))
+    for dep in target.deps:
+        sha.update(stamps[dep].encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _closure(names):
+    """
+    The requested targets and all targets they depend on, in dependency order.
+    """
+    order, seen = [], set()
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.add(name)
+        for dep in TARGETS[name].deps:
+            visit(dep)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+def _run(target, params):
+    target.action(target, params)
+    return target.name
+
+
+def build(names=None, params=None, force=False, workers=None, state_path=None):
+    """
+    Rebuilds the stale targets among names (default: all) and their
+    dependencies, independent targets in parallel.
+
+    Args:
+        names: Target names to bring up to date.
+        params: Overrides of PARAMS.
+        force: Rebuild the requested targets even if they are up to date.
+        workers: Number of worker processes.
+        state_path: JSON file with the stamps of the last successful builds.
+
+    Returns:
+        A dictionary {target: 'built' | 'up to date' | 'skipped: ...' |
+        'failed: ...'}.
+    """
+    params = {**PARAMS, **(params or {})}
+    state_path = state_path or os.path.join(BUILD_DIR, "state.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    order = _closure(names or list(TARGETS))
+    stamps, stale = {}, set()
+    for name in order:
+        target = TARGETS[name]
+        stamps[name] = stamp(target, params, stamps)
+        if (state.get(name) != stamps[name] or not all(os.path.exists(p) for p in target.outputs)
+                or (force and name in (names or order))):
+            stale.add(name)
+
+    status = {name: "up to date" for name in order if name not in stale}
+    for name in [n for n in order if n in stale]:
+        tool = TARGETS[name].tool
+        if tool is not None and shutil.which(tool) is None:
+            stale.discard(name)
+            status[name] = f"skipped: {tool} not installed"
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while stale or pending:
+            for name in [n for n in order if n in stale]:
+                deps = TARGETS[name].deps
+                if any(status.get(d, "").startswith("failed") for d in deps):
+                    stale.discard(name)
+                    status[name] = "failed: dependency failed"
+                elif all(d in status for d in deps):
+                    stale.discard(name)
+                    for path in TARGETS[name].outputs:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                    pending[pool.submit(_run, TARGETS[name], params)] = name
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    status[name] = f"failed: {e}"
+                    continue
+                status[name] = "built"
+                state[name] = stamps[name]
+                with open(state_path, "w") as f:
+                    json.dump(state, f, indent=1)
+    return {name: status[name] for name in order}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the stale figures.")
+    parser.add_argument("targets", nargs="*", help=f"Targets to build: {', '.join(TARGETS)}")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="Override a parameter")
+    parser.add_argument("--force", action="store_true", help="Rebuild the requested targets")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    overrides = {}
+    for item in args.set:
+        key, value = item.split("=", 1)
+        overrides[key] = type(PARAMS[key])(value)
+    for name, result in build(args.targets or None, overrides, args.force, args.workers).items():
+        print(f"{name:>24}: {result}")
@@ -0,0 +1,158 @@
+# convergence.py
+"""
+Convergence diagnostics for parallel MCMC chains.
+
+mda_r only prints an iteration counter, and the burn-in is fixed at the
+NBITER=200 default of PROC MI. A ChainMonitor receives a few scalar
+summaries of theta after every P-step of every chain and keeps their traces
+together with running sums, so the mean and variance of any window of
+iterations cost O(1). From these, split-R-hat (Gelman et al., 2013) and the
+effective sample size with Geyer's initial positive sequence (as in Stan)
+are evaluated for the latest window while the chains are running.
+"""
+import numpy as np
+
+
+class ChainMonitor:
+    """
+    Traces of K monitored scalars for C chains that are updated one
+    iteration at a time.
+    """
+
+    def __init__(self, names, nchains, capacity=1024):
+        self.names = list(names)
+        self.nchains = nchains
+        self.counts = np.zeros(nchains, dtype=np.int64)
+        k = len(self.names)
+        self._trace = np.empty((nchains, capacity, k))
+        # Prefix sums with a leading zero row: window sums are two lookups
+        self._sum = np.zeros((nchains, capacity + 1, k))
+        self._sumsq = np.zeros((nchains, capacity + 1, k))
+
+    def update(self, chain, values):
+        """
+        Adds the monitored values of the next iteration of a chain.
+        """
+        t = self.counts[chain]
+        if t == self._trace.shape[1]:
+            self._grow()
+        values = np.asarray(values, dtype=np.float64)
+        self._trace[chain, t] = values
+        self._sum[chain, t + 1] = self._sum[chain, t] + values
+        self._sumsq[chain, t + 1] = self._sumsq[chain, t] + values ** 2
+        self.counts[chain] = t + 1
+
+    def _grow(self):
+        c, cap, k = self._trace.shape
+        for name in ("_trace", "_sum", "_sumsq"):
+            old = getattr(self, name)
+            new = np.zeros((c, old.shape[1] + cap, k))
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+
+    @property
+    def niter(self):
+        """
+        Number of iterations completed by every chain.
+        """
+        return int(self.counts.min())
+
+    def trace(self, start=0, stop=None):
+        """
+        The traces of all chains, shape (C, iterations, K).
+        """
+        stop = self.niter if stop is None else stop
+        return self._trace[:, start:stop].copy()
+
+    def _moments(self, start, stop):
+        """
+        Means and variances (ddof=1) of the window [start, stop) per chain.
+        """
+        w = stop - start
+        total = self._sum[:, stop] - self._sum[:, start]
+        squares = self._sumsq[:, stop] - self._sumsq[:, start]
+        mean = total / w
+        var = np.maximum(squares - w * mean ** 2, 0.0) / (w - 1)
+        return mean, var
+
+    def split_rhat(self, start=0, stop=None):
+        """
+        Split-R-hat of every monitored scalar over the window: each chain is
+        cut into two halves, and the between- and within-half variances of
+        the 2C halves are compared.
+
+        Returns:
+            Array of shape (K,); nan while the window has fewer than 4
+            iterations.
+        """
+        stop = self.niter if stop is None else stop
+        h = (stop - start) // 2
+        if h < 2:
+            return np.full(len(self.names), np.nan)
+        m1, v1 = self._moments(start, start + h)
+        m2, v2 = self._moments(stop - h, stop)
+        means = np.concatenate([m1, m2])
+        within = np.concatenate([v1, v2]).mean(axis=0)
+        between = h * means.var(axis=0, ddof=1)
+        var_plus = (h - 1) / h * within + between / h
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(within > 0, np.sqrt(var_plus / within), np.nan)
+
+    def autocorr(self, start=0, stop=None, max_lag=None):
+        """
+        Autocorrelations of every chain over the window, computed with the
+        FFT, shape (C, lags, K).
+        """
+        x = self.trace(start, stop)
+        w = x.shape[1]
+        x = x - x.mean(axis=1, keepdims=True)
+        size = 1 << (2 * w - 1).bit_length()
+        spectrum = np.fft.rfft(x, n=size, axis=1)
+        acov = np.fft.irfft(spectrum * np.conj(spectrum), n=size, axis=1)[:, :w] / w
+        with np.errstate(divide="ignore", invalid="ignore"):
+            acf = acov / acov[:, :1]
+        return acf if max_lag is None else acf[:, :max_lag + 1]
+
+    def ess(self, start=0, stop=None):
+        """
+        Effective sample size of every monitored scalar over the window,
+        pooled across chains: the autocorrelations of all chains are combined
+        with the between-chain variance, and the sum is truncated by Geyer's
+        initial monotone positive sequence.
+
+        Returns:
+            Array of shape (K,).
+        """
+        stop = self.niter if stop is None else stop
+        w = stop - start
+        if w < 4:
+            return np.full(len(self.names), np.nan)
+        acf = self.autocorr(start, stop)
+        mean, var = self._moments(start, stop)
+        within = var.mean(axis=0)
+        var_plus = (w - 1) / w * within + (mean.var(axis=0, ddof=1) if self.nchains > 1 else 0.0)
+        acov = acf * var[:, None, :] * (w - 1) / w
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rho = 1 - (within - acov.mean(axis=0)) / var_plus
+        out = np.empty(len(self.names))
+        for k in range(len(self.names)):
+            if not var_plus[k] > 0:
+                out[k] = np.nan
+                continue
+            pairs = rho[:w - w % 2, k].reshape(-1, 2).sum(axis=1)
+            positive = np.flatnonzero(pairs <= 0)
+            pairs = pairs[:positive[0] if len(positive) else len(pairs)]
+            pairs = np.minimum.accumulate(pairs)
+            tau = max(-1 + 2 * pairs.sum(), 1 / np.log10(self.nchains * w))
+            out[k] = self.nchains * w / tau
+        return out
+
+    def summary(self, start=0, stop=None):
+        """
+        Diagnostics of the window as a dictionary with 'names', 'niter',
+        'start', 'mean' (over all chains), 'rhat' and 'ess'.
+        """
+        stop = self.niter if stop is None else stop
+        mean, _ = self._moments(start, stop)
+        return {"names": self.names, "niter": stop, "start": start, "mean": mean.mean(axis=0),
+                "rhat": self.split_rhat(start, stop), "ess": self.ess(start, stop)}
@@ -0,0 +1,214 @@
+# cube.py
+"""
+Preallocated (M, n, p) store for multiply imputed data.
+
+step1 and step2 in function/two_step_imputation.R grow their results with
+rbind, which copies everything accumulated so far for every new imputation.
+Here the full cube is allocated once as float32, optionally backed by a
+memory-mapped file, imputation stages write their slices in place and
+downstream stages read slices as views. A file-backed cube keeps track of
+which imputations have been written and can be reopened after a restart.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DTYPE = np.float32
+
+
+def cube_nbytes(nimpute, n, p):
+    """
+    Memory (or disk) footprint of a cube in bytes.
+    """
+    return nimpute * n * p * np.dtype(DTYPE).itemsize
+
+
+class ImputationCube:
+    """
+    Imputed values of shape (nimpute, n, p), one slice per imputation.
+
+    Use create_cube or open_cube rather than the constructor. For a
+    file-backed cube, 'path' is a directory holding 'cube.npy' (the values),
+    'filled.npy' (which imputations were written) and 'meta.json' (shape,
+    columns and the settings stored with update_meta).
+    """
+
+    def __init__(self, data, filled, columns, path=None, meta=None):
+        self.data = data
+        self.filled = filled
+        self.columns = list(columns)
+        self.path = path
+        self.meta = dict(meta or {})
+
+    def update_meta(self, **values):
+        """
+        Stores settings of the run that fills the cube, e.g. the random seed,
+        in meta.json of a file-backed cube, so a resumed run can reuse them.
+        """
+        self.meta.update(values)
+        if self.path is not None:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                meta = json.load(f)
+            meta.setdefault("settings", {}).update(values)
+            tmp = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nimpute(self):
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def write(self, imputation, values):
+        """
+        Stores one imputation (0-based) in place and marks it as filled.
+        """
+        self.data[imputation] = values
+        self.filled[imputation] = True
+
+    def apply_mask(self, mask):
+        """
+        Sets the cells where the (n, p) boolean mask is True back to missing
+        in every imputation at once, e.g. PatternIndex.dropout to keep only
+        the imputations needed for a monotone pattern (IMPUTE=MONOTONE).
+        """
+        np.copyto(self.data, np.nan, where=mask)
+
+    def missing(self):
+        """
+        Imputation numbers (0-based) that have not been written yet.
+        """
+        return np.flatnonzero(~self.filled)
+
+    def flush(self):
+        """
+        Writes pending changes of a file-backed cube to disk.
+        """
+        if self.path is not None:
+            self.data.flush()
+            self.filled.flush()
+
+    def long(self, visits, subjects=None):
+        """
+        Long-format (impno, subject, visit, value) view of the visit columns,
+        see LongView.
+        """
+        return LongView(self, visits, subjects)
+
+
+class LongView:
+    """
+    Long format of an ImputationCube without copying or building keys.
+
+    convert_long in imputation.R stacks the imputations, pivots them to one
+    row per imputation, subject and visit and pastes SUBJID and AVISIT into
+    an id string for every row. Here every long "row" is a cell of the
+    (M, n, V) cube slice: 'value' is a strided view of the cube and the
+    integer keys 'impno', 'subject' and 'visit' are broadcast views of
+    arange vectors, so no memory is used for them. The labels of the codes
+    are in 'subjects' and 'visits'.
+    """
+
+    AXES = {"impno": 0, "subject": 1, "visit": 2}
+
+    def __init__(self, cube, visits, subjects=None):
+        self.cube = cube
+        self.visits = list(visits)
+        cols = [cube.columns.index(v) for v in self.visits]
+        if cols == list(range(cols[0], cols[0] + len(cols))):
+            self.value = cube.data[:, :, cols[0]:cols[-1] + 1]
+        else:
+            # Non-adjacent visit columns cannot be expressed as one view
+            self.value = cube.data[:, :, cols]
+        nimpute, n, nvisit = self.value.shape
+        self.subjects = np.arange(n) if subjects is None else np.asarray(subjects)
+        self.impno = np.broadcast_to(np.arange(nimpute, dtype=np.int32)[:, None, None], self.value.shape)
+        self.subject = np.broadcast_to(np.arange(n, dtype=np.int32)[None, :, None], self.value.shape)
+        self.visit = np.broadcast_to(np.arange(nvisit, dtype=np.int16)[None, None, :], self.value.shape)
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    def __len__(self):
+        return self.value.size
+
+    def reduce(self, func, by="visit"):
+        """
+        Applies a NumPy reduction (e.g. np.mean, np.var) to the values of
+        every group of the key(s) in by, over all other keys.
+
+        Returns:
+            An array with one axis per key in by, in impno, subject, visit order.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        keep = sorted(self.AXES[key] for key in by)
+        return func(self.value, axis=tuple(a for a in range(3) if a not in keep))
+
+    def to_frame(self, impno=None):
+        """
+        Materializes the long data of the given imputations (0-based, all by
+        default) as a DataFrame with integer 'impno' (1-based, as in R) and
+        categorical 'SUBJID' and 'AVISIT'.
+        """
+        index = np.arange(self.shape[0]) if impno is None else np.atleast_1d(impno)
+        block = (index.size,) + self.shape[1:]
+        return pd.DataFrame({
+            "impno": np.broadcast_to(index[:, None, None] + 1, block).ravel(),
+            "SUBJID": pd.Categorical.from_codes(np.broadcast_to(self.subject[:1], block).ravel(), self.subjects),
+            "AVISIT": pd.Categorical.from_codes(np.broadcast_to(self.visit[:1], block).ravel(), self.visits),
+            "CHG": self.value[index].ravel(),
+        })
+
+
+def create_cube(nimpute, n, p, columns=None, path=None):
+    """
+    Allocates an empty cube filled with NaN.
+
+    Args:
+        nimpute, n, p: Number of imputations, rows and variables.
+        columns: Optional variable names.
+        path: Directory for a memory-mapped cube. None keeps it in memory.
+
+    Returns:
+        An ImputationCube.
+    """
+    columns = list(columns) if columns is not None else [f"V{j + 1}" for j in range(p)]
+    if path is None:
+        data = np.full((nimpute, n, p), np.nan, dtype=DTYPE)
+        return ImputationCube(data, np.zeros(nimpute, dtype=bool), columns)
+
+    os.makedirs(path, exist_ok=True)
+    data = np.lib.format.open_memmap(os.path.join(path, "cube.npy"), mode="w+", dtype=DTYPE, shape=(nimpute, n, p))
+    data[:] = np.nan
+    filled = np.lib.format.open_memmap(os.path.join(path, "filled.npy"), mode="w+", dtype=bool, shape=(nimpute,))
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"shape": [nimpute, n, p], "columns": columns}, f)
+    cube = ImputationCube(data, filled, columns, path)
+    cube.flush()
+    return cube
+
+
+def open_cube(path, mode="r+"):
+    """
+    Reopens a file-backed cube, e.g. to resume or read it after a restart.
+    mode="r" gives a read-only view.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    data = np.load(os.path.join(path, "cube.npy"), mmap_mode=mode)
+    filled = np.load(os.path.join(path, "filled.npy"), mmap_mode=mode)
+    return ImputationCube(data, filled, meta["columns"], path, meta.get("settings"))
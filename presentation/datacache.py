@@ -0,0 +1,167 @@
+# datacache.py
+"""
+Content-addressed columnar cache for the project's input files.
+
+The XPT, sas7bdat, CSV and RData inputs are otherwise parsed in full by every
+consumer. Here each source is converted once into one .npy file per column,
+stored under the SHA-256 of the source content. Later loads memory-map just
+the requested columns. The digest of a file is remembered together with its
+size and modification time, one small file per source, so an unchanged file
+is not re-hashed and a changed file automatically maps to a new entry.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from instrument import hit
+
+# Next to the data files, one level above the 'presentation' directory
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache", "columns"))
+
+
+def _read_entry(entry_path):
+    """
+    A stored digest entry, or None when it is missing or unreadable.
+    """
+    try:
+        with open(entry_path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def file_digest(path, cache_dir=CACHE_DIR):
+    """
+    SHA-256 of the file content, re-computed only when the file's size or
+    modification time differ from the last time it was hashed. Each file's
+    digest is kept in its own small JSON file, replaced through a private
+    temporary file, so concurrent callers neither lose each other's entries
+    nor read a partial one.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    entry_dir = os.path.join(cache_dir, "digests")
+    entry_path = os.path.join(entry_dir, hashlib.sha256(path.encode("utf-8")).hexdigest()[:32] + ".json")
+    entry = _read_entry(entry_path)
+    if (entry and entry.get("path") == path and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns):
+        return entry["digest"]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    entry = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": sha.hexdigest()}
+    os.makedirs(entry_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=entry_dir)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, entry_path)
+    except OSError:
+        # Another process holds the entry open (Windows); the digest is recomputed next time
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return entry["digest"]
+
+
+def read_source(path, obj=None):
+    """
+    Parses a source file into a DataFrame. Byte-string columns of SAS files
+    are decoded. For .RData files, obj names the object to read and may be
+    omitted when the file holds a single object (this needs the optional
+    pyreadr package).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".xpt":
+        df = pd.read_sas(path, format="xport")
+    elif ext == ".sas7bdat":
+        df = pd.read_sas(path, format="sas7bdat")
+    elif ext == ".csv":
+        df = pd.read_csv(path)
+    elif ext in (".rdata", ".rda"):
+        try:
+            import pyreadr
+        except ImportError as e:
+            raise ImportError("Reading .RData files requires the 'pyreadr' package (pip install pyreadr).") from e
+        objects = pyreadr.read_r(path)
+        if obj is None and len(objects) != 1:
+            found = f"{len(objects)} objects; choose one of {list(objects)}" if objects else "no objects"
+            raise ValueError(f"'{os.path.basename(path)}' holds {found}.")
+        df = objects[next(iter(objects))] if obj is None else objects[obj]
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+    for col in df.columns:
+        values = df[col].dropna()
+        if df[col].dtype == object and len(values) and isinstance(values.iloc[0], bytes):
+            df[col] = df[col].str.decode("utf-8")
+    return df
+
+
+def _entry_dir(path, obj, cache_dir):
+    key = file_digest(path, cache_dir)
+    if obj is not None:
+        key += "-" + hashlib.sha256(obj.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, key)
+
+
+def _store(df, entry):
+    """
+    Writes one .npy file per column. Text columns are stored as fixed-width
+    unicode so that they can be loaded without pickle. The files are written
+    to a private temporary directory that is renamed to entry at the end; if
+    another process stored the entry first, its copy is kept.
+    """
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(entry) + ".", suffix=".tmp", dir=os.path.dirname(entry))
+    meta = {"columns": [], "nrows": len(df)}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+            array = values.fillna("").astype(str).to_numpy(dtype=str)
+        else:
+            array = values.to_numpy()
+        name = f"{i:04d}.npy"
+        np.save(os.path.join(tmp, name), array, allow_pickle=False)
+        meta["columns"].append({"name": str(col), "file": name})
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(entry):
+            raise
+
+
+def load_table(path, columns=None, obj=None, cache_dir=CACHE_DIR):
+    """
+    Loads a source file through the cache.
+
+    Args:
+        path: XPT, sas7bdat, CSV or RData file.
+        columns: Optional list of columns to load; only these are read.
+        obj: Object name inside an RData file.
+        cache_dir: Cache location.
+
+    Returns:
+        A DataFrame with the requested columns (memory-mapped numeric data).
+    """
+    entry = _entry_dir(path, obj, cache_dir)
+    hit("datacache", os.path.isdir(entry))
+    if not os.path.isdir(entry):
+        _store(read_source(path, obj), entry)
+    with open(os.path.join(entry, "meta.json")) as f:
+        meta = json.load(f)
+    files = {c["name"]: c["file"] for c in meta["columns"]}
+    wanted = list(files) if columns is None else list(columns)
+    missing = [c for c in wanted if c not in files]
+    if missing:
+        raise KeyError(f"Columns not found in '{os.path.basename(path)}': {missing}")
+    return pd.DataFrame({c: np.load(os.path.join(entry, files[c]), mmap_mode="r") for c in wanted})
@@ -0,0 +1,47 @@
+# dataset.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from datacache import load_table
+
+# The app is launched from the 'presentation' directory, the data files live one level up
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+COVARIATE_COLS = ["TRT01PN", "REGIONN", "BLBMIG1N", "BASE"]
+VISIT_PREFIX = "WEEK"
+
+
+def load_wide_data(path=None, columns=None):
+    """
+    Reads the wide dummy dataset (one row per subject, one column per visit)
+    exported from R as 'dummy.xpt'. The file is parsed once and then served
+    from the columnar cache of datacache.py, with character columns decoded
+    to plain strings. columns optionally limits the columns that are loaded.
+    """
+    if path is None:
+        path = os.path.join(DATA_DIR, "dummy.xpt")
+    return load_table(path, columns=columns)
+
+
+def visit_columns(wide, visit_prefix=VISIT_PREFIX):
+    """
+    Returns the visit columns (e.g. WEEK2 ... WEEK56) in visit order.
+    """
+    cols = [c for c in wide.columns if c.startswith(visit_prefix)]
+    return sorted(cols, key=lambda c: int(c[len(visit_prefix):]))
+
+
+def analysis_matrix(wide, covariates=COVARIATE_COLS, visit_prefix=VISIT_PREFIX):
+    """
+    Builds the numeric matrix used for imputation, equivalent to 'adqs_mono'
+    in imputation.R: the covariates followed by the visit variables.
+
+    Returns:
+        A tuple (x, columns) where x is a float64 array of shape (n, p) with
+        NaN for missing values and columns holds the variable names.
+    """
+    columns = list(covariates) + visit_columns(wide, visit_prefix)
+    x = wide[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    return x, columns
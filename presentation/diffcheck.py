@@ -0,0 +1,275 @@
+# diffcheck.py
+"""
+Comparison of two result tables with tolerance rules, as diffdf in R.
+
+diffdf::diffdf works on the 28-row pooled tables of comparison.R but not on
+the 1.4M-row imputed long datasets. Here both tables are read chunk by chunk
+and every row is routed to one of nparts partitions by a hash of its key
+columns, so matching rows always land in the same partition. The partitions
+are spilled to disk as plain .npz arrays (no pickles) and compared one at
+a time: rows are aligned on the keys and every value column is checked at
+once against its absolute and relative tolerance. Keys that are not unique
+within a table are reported, as diffdf does, and left out of the row-wise
+comparison. The result is a per-column summary plus the first offending
+rows.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def read_chunks(path, chunksize=200_000, columns=None):
+    """
+    Iterates over a CSV, XPT or sas7bdat file in DataFrame chunks, with SAS
+    byte strings decoded.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        reader = pd.read_csv(path, chunksize=chunksize, usecols=columns)
+    elif ext in (".xpt", ".sas7bdat"):
+        reader = pd.read_sas(path, format="xport" if ext == ".xpt" else "sas7bdat", chunksize=chunksize)
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+    with reader:
+        for chunk in reader:
+            for col in chunk.columns:
+                values = chunk[col].dropna()
+                if chunk[col].dtype == object and len(values) and isinstance(values.iloc[0], bytes):
+                    chunk[col] = chunk[col].str.decode("utf-8")
+            yield chunk if columns is None else chunk[list(columns)]
+
+
+def _as_chunks(table):
+    if isinstance(table, pd.DataFrame):
+        return [table]
+    if isinstance(table, str):
+        return read_chunks(table)
+    return table
+
+
+def _normalize_keys(df, keys):
+    """
+    Key columns as float64 (numbers) or str, so that 1 and 1.0 or a decoded
+    and a plain string hash and match the same way in both tables.
+    """
+    df = df.copy()
+    for key in keys:
+        if pd.api.types.is_numeric_dtype(df[key]):
+            df[key] = df[key].astype(np.float64)
+        else:
+            # Strip the distinct values only, keys repeat heavily
+            codes, uniques = pd.factorize(df[key])
+            uniques = pd.Index(uniques).astype(str).str.strip()
+            df[key] = np.where(codes < 0, "nan", np.asarray(uniques, dtype=object)[codes])
+    return df
+
+
+def _partition(chunks, keys, nparts, directory, side):
+    """
+    Spills the rows of every chunk to the partition given by the hash of
+    their keys. Returns the columns, dtypes and row count of the table.
+    """
+    columns, dtypes, nrows = None, None, 0
+    for i, chunk in enumerate(chunks):
+        chunk = _normalize_keys(chunk, keys)
+        if columns is None:
+            columns, dtypes = list(chunk.columns), chunk.dtypes.to_dict()
+        nrows += len(chunk)
+        part = pd.util.hash_pandas_object(chunk[keys], index=False).to_numpy() % nparts
+        for p in np.unique(part):
+            _spill(chunk[part == p], os.path.join(directory, f"{side}_{p:04d}_{i:06d}.npz"))
+    return columns, dtypes, nrows
+
+
+def _spill(df, path):
+    """
+    Writes a DataFrame as one array per column. Numbers, booleans and dates
+    are kept as they are; other columns are stored as unicode strings with a
+    mask of the missing values, so the file never needs pickle to load.
+    """
+    arrays = {}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if values.dtype.kind in "biufcmM":
+            arrays[f"v{i}"] = values.to_numpy()
+        else:
+            missing = values.isna().to_numpy()
+            arrays[f"v{i}"] = np.asarray(values.astype(object).where(~missing, "").astype(str), dtype=str)
+            arrays[f"m{i}"] = missing
+    np.savez(path, **arrays)
+
+
+def _load_spill(path, dtypes):
+    with np.load(path, allow_pickle=False) as f:
+        data = {}
+        for i, (col, dtype) in enumerate(dtypes.items()):
+            values = f[f"v{i}"]
+            if f"m{i}" in f:
+                values = np.where(f[f"m{i}"], None, values.astype(object))
+                data[col] = pd.Series(values, dtype=object).astype(dtype)
+            else:
+                data[col] = pd.Series(values, dtype=dtype)
+    return pd.DataFrame(data)
+
+
+def _load_part(directory, side, p, dtypes):
+    files = sorted(f for f in os.listdir(directory) if f.startswith(f"{side}_{p:04d}_"))
+    if not files:
+        return None
+    return pd.concat([_load_spill(os.path.join(directory, f), dtypes) for f in files], ignore_index=True)
+
+
+def _empty(dtypes):
+    return pd.DataFrame({c: pd.Series(dtype=t) for c, t in dtypes.items()})
+
+
+def _mismatch(a, b, atol, rtol):
+    """
+    True where a and b differ: numbers beyond atol + rtol * |b| (NaN equal
+    to NaN), other values when not equal.
+    """
+    if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+        a = a.to_numpy(dtype=np.float64)
+        b = b.to_numpy(dtype=np.float64)
+        diff = np.abs(a - b)
+        both_nan = np.isnan(a) & np.isnan(b)
+        return ~both_nan & ~(diff <= atol + rtol * np.abs(b)), diff
+    a, b = a.astype(object), b.astype(object)
+    equal = (a == b) | (a.isna() & b.isna())
+    return ~equal.to_numpy(dtype=bool), np.full(len(a), np.nan)
+
+
+def compare_tables(base, compare, keys, tolerance=0.0, rel_tolerance=0.0, tolerances=None, columns=None,
+                   nparts=16, max_rows=10, workdir=None):
+    """
+    Compares two tables row by row on their keys.
+
+    Args:
+        base, compare: DataFrames, file paths (read in chunks) or iterables
+                       of DataFrame chunks.
+        keys: Key columns, e.g. ["SUBJID", "AVISIT", "impno"].
+        tolerance, rel_tolerance: Default absolute and relative tolerance of
+                                  numeric columns.
+        tolerances: Per-column overrides {column: (abs, rel)}.
+        columns: Value columns to compare; default all common non-key columns.
+        nparts: Number of hash partitions (1 compares everything at once).
+        max_rows: Number of offending rows to return.
+        workdir: Directory for the partition files (a temporary one by default).
+
+    Returns:
+        A dictionary with
+            'equal': True if no differences were found,
+            'nrows': rows of (base, compare),
+            'base_only', 'compare_only': columns found in one table only,
+            'dtypes': columns whose types differ, {column: (base, compare)},
+            'missing': number of keys only in base and only in compare,
+            'duplicates': number of rows with a non-unique key in base and
+                          in compare; these rows are not compared,
+            'key_dtypes': key columns that are numeric in one table and
+                          text in the other, {key: (base, compare)}; no
+                          rows are compared then,
+            'summary': DataFrame per value column with 'compared',
+                       'mismatches', 'max_abs_diff' and 'max_rel_diff',
+            'rows': first max_rows mismatching values (keys, column, base,
+                    compare, abs_diff),
+            'missing_rows': first max_rows keys found in one table only,
+            'duplicate_rows': first max_rows non-unique keys with their
+                              count in each table.
+    """
+    keys = list(keys)
+    tolerances = tolerances or {}
+    directory = workdir or tempfile.mkdtemp(prefix="diffcheck_")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        base_cols, base_types, base_n = _partition(_as_chunks(base), keys, nparts, directory, "base")
+        comp_cols, comp_types, comp_n = _partition(_as_chunks(compare), keys, nparts, directory, "compare")
+        common = [c for c in base_cols if c in comp_cols and c not in keys]
+        columns = common if columns is None else list(columns)
+        key_dtypes = {k: (str(base_types[k]), str(comp_types[k])) for k in keys
+                      if pd.api.types.is_numeric_dtype(base_types[k]) != pd.api.types.is_numeric_dtype(comp_types[k])}
+
+        counts = {c: np.zeros(2, dtype=np.int64) for c in columns}
+        max_abs = dict.fromkeys(columns, 0.0)
+        max_rel = dict.fromkeys(columns, 0.0)
+        missing = np.zeros(2, dtype=np.int64)
+        duplicates = np.zeros(2, dtype=np.int64)
+        rows, missing_rows, duplicate_rows = [], [], []
+        # Keys of different kinds can never match, so there is nothing to align
+        for p in range(0 if key_dtypes else nparts):
+            left = _load_part(directory, "base", p, base_types)
+            right = _load_part(directory, "compare", p, comp_types)
+            if left is None and right is None:
+                continue
+            left = left if left is not None else _empty(base_types)
+            right = right if right is not None else _empty(comp_types)
+            # All rows of a key are in the same partition, so uniqueness is checked per partition
+            dup_left = left.duplicated(keys, keep=False).to_numpy()
+            dup_right = right.duplicated(keys, keep=False).to_numpy()
+            duplicates += [dup_left.sum(), dup_right.sum()]
+            if (dup_left.any() or dup_right.any()) and sum(len(r) for r in duplicate_rows) < max_rows:
+                counts_left = left[dup_left].groupby(keys, dropna=False).size().rename("base")
+                counts_right = right[dup_right].groupby(keys, dropna=False).size().rename("compare")
+                dups = pd.concat([counts_left, counts_right], axis=1).fillna(0).astype(np.int64)
+                duplicate_rows.append(dups.reset_index().head(max_rows))
+            if dup_left.any() or dup_right.any():
+                # Drop a non-unique key from both tables so it is not also counted as missing
+                dup_keys = pd.MultiIndex.from_frame(pd.concat([left.loc[dup_left, keys], right.loc[dup_right, keys]]))
+                left = left[~pd.MultiIndex.from_frame(left[keys]).isin(dup_keys)]
+                right = right[~pd.MultiIndex.from_frame(right[keys]).isin(dup_keys)]
+            merged = left[keys + columns].merge(right[keys + columns], on=keys, how="outer",
+                                                suffixes=("__base", "__compare"), indicator=True)
+            side = merged["_merge"]
+            missing += [(side == "left_only").sum(), (side == "right_only").sum()]
+            if len(missing_rows) < max_rows and (side != "both").any():
+                lost = merged.loc[side != "both", keys].copy()
+                lost["found_in"] = np.where(side[side != "both"] == "left_only", "base", "compare")
+                missing_rows.append(lost.head(max_rows))
+            matched = merged[side == "both"]
+            for col in columns:
+                atol, rtol = tolerances.get(col, (tolerance, rel_tolerance))
+                a, b = matched[f"{col}__base"], matched[f"{col}__compare"]
+                bad, diff = _mismatch(a, b, atol, rtol)
+                counts[col] += [len(matched), bad.sum()]
+                if bad.any() and np.isfinite(diff[bad]).any():
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        rel = diff[bad] / np.abs(b.to_numpy(dtype=np.float64)[bad])
+                    max_abs[col] = max(max_abs[col], np.nanmax(diff[bad]))
+                    max_rel[col] = max(max_rel[col], np.nanmax(rel))
+                if bad.any() and sum(len(r) for r in rows) < max_rows:
+                    offending = matched.loc[bad, keys].copy()
+                    offending["column"] = col
+                    offending["base"] = a[bad].to_numpy()
+                    offending["compare"] = b[bad].to_numpy()
+                    offending["abs_diff"] = diff[bad]
+                    rows.append(offending.head(max_rows))
+    finally:
+        if workdir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    summary = pd.DataFrame({
+        "compared": [counts[c][0] for c in columns],
+        "mismatches": [counts[c][1] for c in columns],
+        "max_abs_diff": [max_abs[c] for c in columns],
+        "max_rel_diff": [max_rel[c] for c in columns],
+    }, index=pd.Index(columns, name="column"))
+    dtypes = {c: (str(base_types[c]), str(comp_types[c])) for c in common if str(base_types[c]) != str(comp_types[c])}
+    base_only = [c for c in base_cols if c not in comp_cols]
+    compare_only = [c for c in comp_cols if c not in base_cols]
+    return {
+        "equal": not (summary["mismatches"].any() or missing.any() or duplicates.any() or key_dtypes
+                      or base_only or compare_only),
+        "nrows": (base_n, comp_n),
+        "base_only": base_only,
+        "compare_only": compare_only,
+        "dtypes": dtypes,
+        "missing": tuple(int(m) for m in missing),
+        "duplicates": tuple(int(d) for d in duplicates),
+        "key_dtypes": key_dtypes,
+        "summary": summary,
+        "rows": pd.concat(rows, ignore_index=True).head(max_rows) if rows else pd.DataFrame(),
+        "missing_rows": pd.concat(missing_rows, ignore_index=True).head(max_rows) if missing_rows else pd.DataFrame(),
+        "duplicate_rows": pd.concat(duplicate_rows, ignore_index=True).head(max_rows) if duplicate_rows else pd.DataFrame(),
+    }
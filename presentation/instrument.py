@@ -0,0 +1,143 @@
+# instrument.py
+"""
+Lightweight instrumentation of the computation code paths.
+
+Stages are timed with the stage context manager or the timed decorator,
+long loops report their progress, and caches count hits and misses. All
+records go to one process-wide Recorder: a bounded deque of finished stage
+events, a dictionary of counters and the progress of the stages that are
+running. Recording is a perf_counter call and a few dictionary updates
+under the recorder's lock, so the hooks stay in the hot paths; snapshot()
+takes the same lock and gives the Performance page a consistent copy while
+a run executes in another thread.
+"""
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+def memory_mb():
+    """
+    Current and peak resident set size of the process in MB, read from
+    /proc/self/status (Linux); (nan, nan) elsewhere.
+    """
+    rss = peak = float("nan")
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss, peak
+
+
+class Recorder:
+    """
+    Collects stage timings, counters and progress of running stages.
+    """
+
+    def __init__(self, maxlen=2000):
+        self.events = deque(maxlen=maxlen)
+        self.counters = defaultdict(int)
+        self.running = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block and records it as one event of stage name.
+        """
+        key = (name, threading.get_ident())
+        start = time.perf_counter()
+        with self.lock:
+            self.running[key] = {"stage": name, "start": start, "done": 0, "total": None}
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            rss, peak = memory_mb()
+            with self.lock:
+                self.running.pop(key, None)
+                self.events.append({"stage": name, "time": time.time(), "seconds": end - start,
+                                    "rss_mb": rss, "peak_rss_mb": peak})
+
+    def timed(self, name):
+        """
+        Decorator recording every call of the function as stage name.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def progress(self, name, done, total=None):
+        """
+        Reports that the running stage name has completed done of total
+        iterations; also counts the iterations as '<name>_iterations'.
+        """
+        with self.lock:
+            entry = self.running.get((name, threading.get_ident()))
+            if entry is not None:
+                self.counters[f"{name}_iterations"] += done - entry["done"]
+                entry["done"], entry["total"] = done, total
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def hit(self, cache, hit=True):
+        """
+        Counts a hit (or a miss) of the named cache.
+        """
+        with self.lock:
+            self.counters[f"{cache}_{'hits' if hit else 'misses'}"] += 1
+
+    def snapshot(self):
+        """
+        A copy of the current state.
+
+        Returns:
+            A dictionary with 'events' (list of finished stages), 'counters',
+            'running' (stage, elapsed seconds, done, total and iterations per
+            second of the running stages), 'hit_rate' per cache, 'rss_mb'
+            and 'peak_rss_mb'.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+            running = [dict(entry) for entry in self.running.values()]
+        for entry in running:
+            entry["elapsed"] = now - entry.pop("start")
+            entry["rate"] = entry["done"] / entry["elapsed"] if entry["elapsed"] > 0 else 0.0
+        caches = {key[:-5] for key in counters if key.endswith("_hits")}
+        caches |= {key[:-7] for key in counters if key.endswith("_misses")}
+        hit_rate = {}
+        for cache in caches:
+            hits, misses = counters.get(f"{cache}_hits", 0), counters.get(f"{cache}_misses", 0)
+            hit_rate[cache] = hits / (hits + misses)
+        rss, peak = memory_mb()
+        return {"events": events, "counters": counters, "running": running, "hit_rate": hit_rate,
+                "rss_mb": rss, "peak_rss_mb": peak}
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.counters.clear()
+
+
+RECORDER = Recorder()
+stage = RECORDER.stage
+timed = RECORDER.timed
+progress = RECORDER.progress
+count = RECORDER.count
+hit = RECORDER.hit
+snapshot = RECORDER.snapshot
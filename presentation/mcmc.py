@@ -0,0 +1,753 @@
+# mcmc.py
+"""
+Monotone data augmentation (MCMC) for the multivariate normal model.
+
+This is the Python counterpart of prelim.norm.new, em.norm, mda_r and imp.norm
+as used by step1 in function/two_step_imputation.R. The R translation of the
+Fortran routines (is2n, ps2n, tobsmn) loops over every row and every element;
+here all rows that share a missingness pattern are imputed with one matrix
+operation, and the P-step works on cross-product matrices of whole row blocks.
+
+Parameters are kept in the same form as the norm package: a (p+1) x (p+1)
+matrix theta with theta[0, 0] = -1, the means in row/column 0 and the
+covariance matrix in theta[1:, 1:], all on the standardized scale.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+
+from convergence import ChainMonitor
+from cube import create_cube, open_cube
+from instrument import hit, progress, timed
+from patterns import build_pattern_index
+
+# Converged EM estimates, next to the data files like the column cache
+EM_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache", "em"))
+EM_CACHE_ENTRIES = 64
+
+
+@timed("prelim")
+def prelim_norm(x):
+    """
+    Groups the rows of x by missingness pattern with a PatternIndex and
+    standardizes the data for EM and monotone data augmentation
+    (equivalent of prelim.norm.new).
+
+    Args:
+        x: Numeric array of shape (n, p) with NaN for missing values.
+
+    Returns:
+        A dictionary with the same components as the R list plus the input
+        'data' and the PatternIndex 'index': the standardized, pattern-sorted
+        data 'x', 'n', 'p', the observed-indicator matrix 'r'
+        (one row per pattern), 'ro' to restore the original row order,
+        'mdpst', 'nmdp', 'npatt', 'xbar', 'sdv', 'sj', 'nmon', 'last',
+        'layer' and 'nlayer'. Pattern and variable counts are plain numbers,
+        indices into rows and columns are 0-based.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[:, None]
+    data = x
+    n, p = x.shape
+    miss = np.isnan(x)
+    nmis = miss.sum(axis=0)
+
+    index = build_pattern_index(x)
+    x = x[index.order]
+    miss = miss[index.order]
+
+    # Center and scale with the observed values of each column (ctrsc)
+    observed = ~miss
+    counts = observed.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xbar = np.where(counts > 0, np.nansum(x, axis=0) / counts, 0.0)
+        var = np.where(counts > 1, np.nansum((x - xbar) ** 2, axis=0) / (counts - 1), 1.0)
+    sdv = np.where(var > 0, np.sqrt(var), 1.0)
+    x = (x - xbar) / sdv
+
+    return {
+        "data": data, "x": x, "n": n, "p": p, "index": index,
+        "r": index.r.astype(np.int8), "nmis": nmis, "ro": index.ro,
+        "mdpst": index.mdpst, "nmdp": index.nmdp, "npatt": index.npatt,
+        "xbar": xbar, "sdv": sdv, "sj": index.sj, "nmon": index.nmon,
+        "last": index.last, "layer": index.layer, "nlayer": index.nlayer,
+    }
+
+
+def make_theta(mu, sigma):
+    """
+    Packs a mean vector and covariance matrix into the theta matrix.
+    """
+    p = len(mu)
+    theta = np.empty((p + 1, p + 1))
+    theta[0, 0] = -1.0
+    theta[0, 1:] = mu
+    theta[1:, 0] = mu
+    theta[1:, 1:] = sigma
+    return theta
+
+
+def get_param(s, theta):
+    """
+    Returns the mean vector and covariance matrix of theta on the original
+    scale of the data (equivalent of getparam.norm).
+    """
+    mu = theta[0, 1:] * s["sdv"] + s["xbar"]
+    sigma = theta[1:, 1:] * np.outer(s["sdv"], s["sdv"])
+    return mu, sigma
+
+
+def sweep(theta, k, direction=1):
+    """
+    Sweeps theta in place on pivot position k (0 is the constant).
+    direction=1 performs the ordinary sweep, direction=-1 the reverse sweep
+    (same conventions as swp in function/Fortran_function.R).
+    """
+    a = theta[k, k]
+    col = theta[:, k] * (direction / a)
+    theta -= a * np.outer(col, col)
+    theta[:, k] = col
+    theta[k, :] = col
+    theta[k, k] = -1.0 / a
+    return theta
+
+
+def _swpobs(tt, swept, observed):
+    """
+    Sweeps tt in place so that it conditions on exactly the observed
+    variables of a pattern (swpobs). swept tracks the current sweep status of
+    the variables and is updated as well.
+    """
+    for k in np.flatnonzero(observed & ~swept):
+        sweep(tt, k + 1, 1)
+    for k in np.flatnonzero(~observed & swept):
+        sweep(tt, k + 1, -1)
+    swept[:] = observed
+    return tt
+
+
+def _patterns(s, monotone):
+    """
+    Yields (observed, rows, oc, mc) for every pattern with something to
+    impute, where observed is the pattern's observed indicator, rows the slice
+    of the pattern in the sorted data and oc/mc the observed/missing columns.
+    With monotone=True, only missing columns up to the last observed variable
+    are returned (is2n), otherwise all of them.
+    """
+    index = s["index"]
+    for patt in range(index.npatt):
+        mc = index.mis_cols[patt]
+        if monotone:
+            mc = mc[mc < index.last[patt]]
+        if len(mc) == 0:
+            continue
+        yield index.r[patt], index.rows(patt), index.obs_cols[patt], mc
+
+
+def i_step(s, x, theta, rng, monotone=True):
+    """
+    I-step: draws the missing values of x from their conditional
+    distribution given the observed values and theta, one pattern at a time.
+    x is modified in place and returned.
+    """
+    tt = theta.copy()
+    swept = np.zeros(s["p"], dtype=bool)
+    for observed, rows, oc, mc in _patterns(s, monotone):
+        _swpobs(tt, swept, observed)
+        intercept = tt[0, mc + 1]
+        coef = tt[np.ix_(oc + 1, mc + 1)]
+        upper = np.linalg.cholesky(tt[np.ix_(mc + 1, mc + 1)]).T
+        z = rng.standard_normal((rows.stop - rows.start, len(mc)))
+        x[rows, mc] = intercept + x[rows][:, oc] @ coef + z @ upper
+    return x
+
+
+def _layer_crossproducts(s, x):
+    """
+    Cross-product matrices of [1, x] over the leading nmon[j] rows for every
+    distinct nmon (the rows used for the regression of variable j+1 in the
+    P-step). Cells after a row's last observed variable are never read.
+    """
+    z = np.empty((s["n"], s["p"] + 1))
+    z[:, 0] = 1.0
+    z[:, 1:] = np.nan_to_num(x, nan=0.0)
+    cps = {}
+    acc = np.zeros((s["p"] + 1, s["p"] + 1))
+    prev = 0
+    for stop in np.unique(s["nmon"][s["nmon"] > 0]):
+        block = z[prev:stop]
+        acc = acc + block.T @ block
+        cps[stop] = acc
+        prev = stop
+    return cps
+
+
+def p_step(s, x, rng):
+    """
+    P-step: draws theta from its posterior given the monotone completed data
+    (ps2n). Variable j is regressed on variables 1..j-1 using the rows that
+    take part in the monotone pattern up to j; residual variances and
+    coefficients are drawn and then converted back to means and covariances.
+    """
+    p = s["p"]
+    cps = _layer_crossproducts(s, x)
+    coef = np.zeros((p, p))
+    intercept = np.zeros(p)
+    resid = np.zeros(p)
+    for j in range(1, p + 1):
+        nmon = s["nmon"][j - 1]
+        if nmon == 0:
+            raise ValueError(f"Variable {j} is never observed; monotone data augmentation is not possible.")
+        t = cps[nmon][:j + 1, :j + 1]
+        factor = cho_factor(t[:j, :j], lower=True)
+        beta = cho_solve(factor, t[:j, j])
+        sse = t[j, j] - t[:j, j] @ beta
+        df = nmon + 3 * (p - j) - 1
+        resid[j - 1] = sse / rng.chisquare(df)
+        v = rng.standard_normal(j)
+        beta = beta + np.sqrt(resid[j - 1]) * solve_triangular(factor[0], v, lower=True, trans="T")
+        intercept[j - 1] = beta[0]
+        coef[j - 1, :j - 1] = beta[1:]
+
+    # x = c + B x + e  =>  mu = (I - B)^-1 c,  Sigma = (I - B)^-1 D (I - B)^-T  (ph2thn)
+    inv = solve_triangular(np.eye(p) - coef, np.eye(p), lower=True)
+    mu = inv @ intercept
+    sigma = (inv * resid) @ inv.T
+    return make_theta(mu, sigma)
+
+
+@timed("mcmc")
+def mda_norm(s, theta, steps=1, rng=None, showits=False, trace=None):
+    """
+    Runs monotone data augmentation: 'steps' cycles of I-step followed by
+    P-step, starting from theta (equivalent of mda_r).
+
+    Args:
+        s: Output of prelim_norm.
+        theta: Starting parameters, usually the EM estimate.
+        steps: Number of I-step/P-step cycles.
+        rng: numpy Generator used for all draws.
+        showits: If True, prints the iteration counter like mda_r.
+        trace: Optional function called with theta after every P-step,
+               e.g. to feed a ChainMonitor.
+
+    Returns:
+        The parameters after the last P-step.
+    """
+    rng = np.random.default_rng(rng)
+    x = s["x"].copy()
+    if showits:
+        print("Steps of Monotone Data Augmentation:")
+    for i in range(steps):
+        if showits:
+            print(f"{i + 1}...", end="")
+        x = i_step(s, x, theta, rng, monotone=True)
+        theta = p_step(s, x, rng)
+        if trace is not None:
+            trace(theta)
+        progress("mcmc", i + 1, steps)
+    if showits:
+        print()
+    return theta
+
+
+@timed("em")
+def em_norm(s, start=None, maxits=1000, criterion=0.0001, showits=False, accelerate=True, cache_dir=EM_CACHE_DIR):
+    """
+    EM algorithm for the mean and covariance matrix (equivalent of em.norm).
+    Expected sufficient statistics are accumulated one pattern at a time.
+
+    With accelerate=True, every two EM steps are followed by a SQUAREM
+    extrapolation (Varadhan and Roland, 2008, scheme S3) and one stabilizing
+    EM step. The extrapolated point is discarded for the second EM step when
+    its covariance matrix is not positive definite. This needs far fewer EM
+    steps than plain EM when the fraction of missing information is high.
+
+    The estimate is cached on disk under a hash of the data and the
+    arguments, so a repeat run on the same data skips EM entirely.
+
+    Args:
+        s: Output of prelim_norm.
+        start: Optional starting theta. Defaults to zero means and unit
+               variances on the standardized scale.
+        maxits: Maximum number of EM steps.
+        criterion: Convergence is reached when the largest relative change in
+                   any parameter is below this value.
+        accelerate: If False, runs plain EM as em.norm does.
+        cache_dir: Directory of the estimate cache; None disables it.
+
+    Returns:
+        The maximum-likelihood estimate of theta.
+    """
+    n, p, x = s["n"], s["p"], s["x"]
+    theta = make_theta(np.zeros(p), np.eye(p)) if start is None else start.copy()
+    if cache_dir is not None:
+        key = _em_key(s, theta, maxits, criterion, accelerate)
+        cached = _em_cache_load(cache_dir, key)
+        hit("em_cache", cached is not None)
+        if cached is not None:
+            return cached
+    if showits:
+        print("Iterations of EM:")
+
+    def step(theta, it):
+        if showits:
+            print(f"{it + 1}...", end="")
+        progress("em", it + 1, maxits)
+        return _em_step(s, x, theta, n, p)
+
+    def converged(new, old):
+        return np.all(np.abs(new - old) <= criterion * np.abs(old))
+
+    it = 0
+    while it < maxits:
+        t1 = step(theta, it)
+        it += 1
+        if converged(t1, theta) or not accelerate or it == maxits:
+            theta, done = t1, converged(t1, theta)
+            if done:
+                break
+            continue
+        t2 = step(t1, it)
+        it += 1
+        if converged(t2, t1) or it == maxits:
+            theta = t2
+            break
+        r = t1 - theta
+        v = t2 - t1 - r
+        # Step length -|r|/|v|, at least as long as the plain EM step (alpha = -1 gives t2)
+        alpha = min(-np.sqrt(np.sum(r ** 2) / np.sum(v ** 2)), -1.0) if np.any(v) else -1.0
+        extrapolated = theta - 2 * alpha * r + alpha ** 2 * v
+        if not _positive_definite(extrapolated[1:, 1:]):
+            extrapolated = t2
+        theta = step(extrapolated, it)
+        it += 1
+        if converged(theta, extrapolated):
+            break
+    if showits:
+        print()
+    if cache_dir is not None:
+        _em_cache_store(cache_dir, key, theta)
+    return theta
+
+
+def _positive_definite(sigma):
+    try:
+        np.linalg.cholesky(sigma)
+    except np.linalg.LinAlgError:
+        return False
+    return True
+
+
+def _em_key(s, start, maxits, criterion, accelerate):
+    """
+    Cache key of an EM run: SHA-256 of the data, its shape, the starting
+    values and the convergence settings.
+    """
+    sha = hashlib.sha256()
+    data = np.ascontiguousarray(s["data"], dtype=np.float64)
+    sha.update(repr((data.shape, maxits, criterion, accelerate)).encode())
+    sha.update(data.tobytes())
+    sha.update(np.ascontiguousarray(start).tobytes())
+    return sha.hexdigest()
+
+
+def _em_cache_load(cache_dir, key):
+    """
+    The cached estimate for key, or None. A hit marks the entry as recently
+    used by updating its modification time.
+    """
+    path = os.path.join(cache_dir, f"{key}.npy")
+    try:
+        theta = np.load(path)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return theta
+
+
+def _em_cache_store(cache_dir, key, theta, max_entries=EM_CACHE_ENTRIES):
+    """
+    Writes the estimate atomically and evicts the least recently used
+    entries beyond max_entries.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.npy")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, theta)
+    os.replace(tmp, path)
+    # Other processes may evict the same entries concurrently, so vanished files are skipped
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npy"):
+            try:
+                entries.append((os.stat(os.path.join(cache_dir, name)).st_mtime_ns, name))
+            except FileNotFoundError:
+                pass
+    entries.sort()
+    for _, name in entries[:max(len(entries) - max_entries, 0)]:
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def _em_step(s, x, theta, n, p):
+    """
+    One E-step and M-step of em_norm.
+    """
+    tt = theta.copy()
+    swept = np.zeros(p, dtype=bool)
+    z = np.empty((n, p + 1))
+    z[:, 0] = 1.0
+    z[:, 1:] = x
+    extra = np.zeros((p + 1, p + 1))
+    for observed, rows, oc, mc in _patterns(s, monotone=False):
+        _swpobs(tt, swept, observed)
+        z[rows, mc + 1] = tt[0, mc + 1] + x[rows][:, oc] @ tt[np.ix_(oc + 1, mc + 1)]
+        extra[np.ix_(mc + 1, mc + 1)] += (rows.stop - rows.start) * tt[np.ix_(mc + 1, mc + 1)]
+    t = z.T @ z + extra
+    mu = t[0, 1:] / n
+    sigma = t[1:, 1:] / n - np.outer(mu, mu)
+    return make_theta(mu, sigma)
+
+
+def imp_norm(s, theta, rng=None):
+    """
+    Imputes every missing value once from theta (equivalent of imp.norm).
+
+    Returns:
+        The completed data on the original scale and in the original row order.
+    """
+    rng = np.random.default_rng(rng)
+    x = i_step(s, s["x"].copy(), theta, rng, monotone=False)
+    return _unscale(s, x)
+
+
+def _unscale(s, x):
+    """
+    Back-transforms pattern-sorted standardized data to the original scale and
+    row order. Observed cells are restored exactly rather than round-tripped.
+    """
+    x = (x * s["sdv"] + s["xbar"])[s["ro"]]
+    return np.where(np.isnan(s["data"]), x, s["data"])
+
+
+def mcmc_impute(data, nimpute, emmaxits=200, maxits=100, seed=None, showits=False, out=None, columns=None,
+                cache_dir=EM_CACHE_DIR):
+    """
+    MCMC imputation to a monotone missing pattern (equivalent of step1).
+
+    Args:
+        data: Numeric array of shape (n, p) with NaN for missing values.
+        nimpute: Number of imputations.
+        emmaxits: Maximum EM iterations for the starting values.
+        maxits: Number of data augmentation steps before imputing.
+        seed: Random seed.
+        out: Optional ImputationCube to write into; by default an in-memory
+             cube is allocated.
+        columns: Optional variable names for a newly allocated cube.
+        cache_dir: Directory of the EM estimate cache; None disables it.
+
+    Returns:
+        The ImputationCube of shape (nimpute, n, p). Values after each
+        subject's last observed visit are left missing, as with
+        IMPUTE=MONOTONE in SAS.
+    """
+    s = prelim_norm(data)
+    thetahat = em_norm(s, maxits=emmaxits, cache_dir=cache_dir)
+    rng = np.random.default_rng(seed)
+    theta = mda_norm(s, thetahat, steps=maxits, rng=rng, showits=showits)
+
+    if out is None:
+        out = create_cube(nimpute, s["n"], s["p"], columns)
+    for i in range(nimpute):
+        out.write(i, imp_norm(s, theta, rng))
+        if showits:
+            print(f"MCMC imputation: {i + 1}...")
+    # Reset values after each subject's last observed visit in all imputations at once
+    out.apply_mask(s["index"].dropout)
+    return out
+
+
+def worst_linear_function(s, thetahat):
+    """
+    Direction of the worst linear function of the parameters (WLF in PROC
+    MI): the unit vector along which EM converges most slowly, estimated
+    from the last change of two further EM steps from thetahat. Parameters
+    are vectorized as the means followed by the upper triangle of the
+    covariance matrix.
+    """
+    n, p, x = s["n"], s["p"], s["x"]
+    first = _em_step(s, x, thetahat, n, p)
+    second = _em_step(s, x, first, n, p)
+    v = _vech(second) - _vech(first)
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else v
+
+
+def _vech(theta):
+    """
+    The means and the upper triangle of the covariance matrix of theta as one
+    vector.
+    """
+    return np.concatenate([theta[0, 1:], theta[1:, 1:][np.triu_indices(theta.shape[0] - 1)]])
+
+
+def monitored(s, thetahat, columns=None):
+    """
+    Scalar summaries of theta that are traced to judge convergence: the
+    mean of the last variable (the last visit), its mean in every treatment
+    arm when columns include TRT01PN, and the worst linear function
+    v'(theta - thetahat).
+
+    Returns:
+        A tuple (names, func) where func(theta) gives the array of values;
+        func can be pickled, so worker processes can evaluate it.
+    """
+    p = s["p"]
+    last = columns[-1] if columns is not None else f"V{p}"
+    names = [f"Mean {last}"]
+    trt, arms = None, np.empty(0)
+    if columns is not None and "TRT01PN" in columns:
+        trt = columns.index("TRT01PN")
+        arms = np.unique(s["data"][:, trt][~np.isnan(s["data"][:, trt])])
+        names += [f"Mean {last}, TRT01PN={arm:g}" for arm in arms]
+    names.append("Worst linear function")
+    return names, _Summaries(s["xbar"], s["sdv"], trt, arms, worst_linear_function(s, thetahat), _vech(thetahat))
+
+
+class _Summaries:
+    """
+    The function of monitored, as an object that can be sent to workers.
+    """
+
+    def __init__(self, xbar, sdv, trt, arms, wlf, center):
+        self.scale = {"xbar": xbar, "sdv": sdv}
+        self.trt, self.arms, self.wlf, self.center = trt, arms, wlf, center
+
+    def __call__(self, theta):
+        mu, sigma = get_param(self.scale, theta)
+        values = [mu[-1]]
+        for arm in self.arms:
+            # Conditional mean given the treatment arm
+            values.append(mu[-1] + sigma[-1, self.trt] / sigma[self.trt, self.trt] * (arm - mu[self.trt]))
+        values.append(self.wlf @ (_vech(theta) - self.center))
+        return np.array(values)
+
+
+def adaptive_burnin(s, thetahat, nchains=4, seed=None, columns=None, min_iter=100, max_iter=2000, check_every=50,
+                    rhat_max=1.01, min_ess=400, callback=None, workers=1):
+    """
+    Runs nchains chains from thetahat in lockstep until the monitored
+    summaries have converged, instead of a fixed burn-in. Every check_every
+    iterations the split-R-hat and the effective sample size of the latest
+    half of the iterations are evaluated; burn-in ends when every R-hat is
+    below rhat_max and every ESS reaches min_ess, after at least min_iter
+    and at most max_iter iterations. Chain c draws from chain_rng(seed, c, 0)
+    like the burn-in of mcmc_impute_chains, so the result equals a fixed
+    burn-in of the same length.
+
+    Args:
+        s: Output of prelim_norm.
+        thetahat: Starting parameters of every chain, usually the EM estimate.
+        columns: Optional variable names for the monitored summaries.
+        callback: Optional function callback(summary) called after every
+                  check with ChainMonitor.summary of the latest half.
+        workers: Number of worker processes. Every segment of check_every
+                 iterations of a chain runs in a worker, which returns the
+                 chain state (theta and the generator state) and the
+                 monitored values; the result does not depend on workers.
+
+    Returns:
+        A dictionary with 'nbiter' (iterations run), 'converged', 'thetas'
+        (the state of every chain), 'monitor' (the ChainMonitor with the
+        traces) and 'checks' (list of the summaries of every check).
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    names, func = monitored(s, thetahat, columns)
+    monitor = ChainMonitor(names, nchains)
+    rngs = [chain_rng(seed, chain, 0) for chain in range(nchains)]
+    states = [(thetahat, rng.bit_generator.state) for rng in rngs]
+    checks = []
+    converged = False
+    workers = max(1, min(nchains, workers or os.cpu_count() or 1))
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_segment, initargs=(s, func)) \
+        if workers > 1 else None
+    if pool is None:
+        _init_segment(s, func)
+    try:
+        while monitor.niter < max_iter and not converged:
+            steps = [min(check_every, max_iter - monitor.niter)] * nchains
+            args = (range(nchains), [theta for theta, _ in states], [state for _, state in states], steps)
+            results = list(pool.map(_run_segment, *args) if pool is not None else map(_run_segment, *args))
+            for chain, (theta, state, values) in enumerate(results):
+                states[chain] = (theta, state)
+                for row in values:
+                    monitor.update(chain, row)
+            if monitor.niter < min_iter:
+                continue
+            summary = monitor.summary(start=monitor.niter // 2)
+            checks.append(summary)
+            converged = bool(np.all(summary["rhat"] < rhat_max) and np.all(summary["ess"] >= min_ess))
+            if callback is not None:
+                callback(summary)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    thetas = [theta for theta, _ in states]
+    return {"nbiter": monitor.niter, "converged": converged, "thetas": thetas, "monitor": monitor,
+            "checks": checks}
+
+
+_SEGMENT = {}
+
+
+def _init_segment(s, func):
+    """
+    Keeps the data and the summary function in the worker, so they are sent
+    once per worker and not with every segment.
+    """
+    _SEGMENT["s"], _SEGMENT["func"] = s, func
+
+
+def _run_segment(chain, theta, state, steps):
+    """
+    Continues a chain for steps iterations from theta and the generator
+    state. Returns the new theta, the new generator state and the monitored
+    values of every iteration, shape (steps, K).
+    """
+    rng = np.random.Generator(np.random.Philox())
+    rng.bit_generator.state = state
+    values = []
+    theta = mda_norm(_SEGMENT["s"], theta, steps=steps, rng=rng,
+                     trace=lambda theta: values.append(_SEGMENT["func"](theta)))
+    return theta, rng.bit_generator.state, np.array(values)
+
+
+def iter_imputations(s, thetahat, nbiter=200, niter=100, rng=None):
+    """
+    Yields the imputations of a single chain one at a time: nbiter burn-in
+    steps, then niter steps between imputations (NBITER and NITER in PROC MI).
+    Every imputation has shape (n, p), on the original scale and with the
+    values after each subject's last observed visit left missing.
+    """
+    rng = np.random.default_rng(rng)
+    theta = mda_norm(s, thetahat, steps=nbiter, rng=rng)
+    while True:
+        x = imp_norm(s, theta, rng)
+        x[s["index"].dropout] = np.nan
+        yield x
+        theta = mda_norm(s, theta, steps=niter, rng=rng)
+
+
+def chain_rng(seed, chain, imputation):
+    """
+    Counter-based random stream for one chain segment. Stream (chain, 0) is
+    the burn-in of a chain and stream (chain, i) covers the iterations that
+    lead to imputation i, so every draw is fixed by (seed, chain, imputation)
+    alone, regardless of which process runs the chain.
+    """
+    return np.random.Generator(np.random.Philox(np.random.SeedSequence(seed, spawn_key=(chain, imputation))))
+
+
+def _run_chain(s, thetahat, chain, imputations, nbiter, niter, seed, path=None):
+    """
+    Runs one chain: nbiter burn-in steps, then niter steps before every
+    imputation after the first (NBITER and NITER in PROC MI). With a path,
+    the imputations are written straight into the file-backed cube,
+    otherwise they are returned as an array.
+    """
+    cube = open_cube(path) if path is not None else None
+    theta = mda_norm(s, thetahat, steps=nbiter, rng=chain_rng(seed, chain, 0))
+    block = np.empty((len(imputations),) + s["x"].shape, dtype=np.float32) if cube is None else None
+    for k, imputation in enumerate(imputations):
+        rng = chain_rng(seed, chain, imputation)
+        if k > 0:
+            theta = mda_norm(s, theta, steps=niter, rng=rng)
+        values = imp_norm(s, theta, rng)
+        if cube is None:
+            block[k] = values
+        else:
+            cube.write(imputation - 1, values)
+    if cube is not None:
+        cube.flush()
+    return block
+
+
+def mcmc_impute_chains(data, nimpute, nchains=4, nbiter=200, niter=100, emmaxits=200, seed=None, workers=None,
+                       out=None, columns=None, cache_dir=EM_CACHE_DIR):
+    """
+    MCMC imputation with the M imputations split over independent chains,
+    each with its own burn-in and NITER iterations between imputations,
+    as in MCMC NBITER=200 NITER=100 of PROC MI. Chains run in worker
+    processes.
+
+    Args:
+        data: Numeric array of shape (n, p) with NaN for missing values.
+        nimpute: Number of imputations.
+        nchains: Number of independent chains; imputations 1..nimpute are
+                 split into consecutive blocks, one per chain.
+        nbiter: Burn-in iterations of every chain, or "auto" to run the
+                chains until convergence with adaptive_burnin.
+        niter: Iterations between two imputations of the same chain.
+        emmaxits: Maximum EM iterations for the starting values.
+        seed: Random seed. The output only depends on seed and nchains,
+              never on the number of workers. With seed=None a fresh seed
+              is drawn, or the one stored in a file-backed out cube when
+              an interrupted run resumes.
+        workers: Number of worker processes. 1 runs the chains in this
+                 process; None uses one worker per chain up to the CPU count.
+        out: Optional ImputationCube to write into. Workers write directly
+             into a file-backed cube, and chains whose imputations are all
+             present already are skipped, so an interrupted run can resume.
+             The seed and nchains are saved in the cube's meta.json, and a
+             resume with a different seed or nchains raises ValueError.
+        columns: Optional variable names for a newly allocated cube.
+        cache_dir: Directory of the EM estimate cache; None disables it.
+
+    Returns:
+        The ImputationCube of shape (nimpute, n, p), monotone as in
+        mcmc_impute.
+    """
+    s = prelim_norm(data)
+    thetahat = em_norm(s, maxits=emmaxits, cache_dir=cache_dir)
+    if out is None:
+        out = create_cube(nimpute, s["n"], s["p"], columns)
+    nchains = max(1, min(nchains, nimpute))
+    if seed is None:
+        seed = out.meta.get("seed", np.random.SeedSequence().entropy)
+    if out.filled.any() and "seed" in out.meta and (out.meta["seed"], out.meta["nchains"]) != (seed, nchains):
+        raise ValueError(f"The cube was partly filled with seed={out.meta.get('seed')} and "
+                         f"nchains={out.meta.get('nchains')}; resume with the same settings.")
+    out.update_meta(seed=int(seed), nchains=nchains)
+    blocks = [block + 1 for block in np.array_split(np.arange(nimpute), nchains)]
+    todo = [(chain, block) for chain, block in enumerate(blocks) if not out.filled[block - 1].all()]
+    starts = [thetahat] * nchains
+    if nbiter == "auto" and todo:
+        # Chains continue from their converged states, which is the same as a fixed burn-in of that length
+        starts, nbiter = adaptive_burnin(s, thetahat, nchains, seed, columns, workers=workers)["thetas"], 0
+    args = [(s, starts[chain], chain, block, nbiter, niter, seed, out.path) for chain, block in todo]
+
+    workers = min(len(args), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        results = [_run_chain(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chain, *zip(*args)))
+    if out.path is None:
+        for (chain, block), values in zip(todo, results):
+            out.data[block - 1] = values
+            out.filled[block - 1] = True
+    else:
+        # Pick up what the workers wrote through their own mappings
+        out = open_cube(out.path)
+    out.apply_mask(s["index"].dropout)
+    out.flush()
+    return out
@@ -0,0 +1,92 @@
+# metrics.py
+"""
+Accuracy of the imputed values against the complete (gold-standard) data.
+
+comparison.R joins every imputed row with data_complete on SUBJID, TRT01P,
+AVISIT and AVISITN, keeps the rows where the values differ and summarises
+twice with group_by. Here the gold standard is laid out once as an (n, V)
+array in the row and visit order of the cube, so the imputed cube and the
+truth line up by position. The missingness mask selects the imputed cells
+and all imputations and visits are reduced at once, in blocks of
+imputations to bound memory.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATA_DIR
+from datacache import load_table
+
+
+def gold_standard(subjects, visits, path=None, subject="SUBJID", visit="AVISIT", value="CHG"):
+    """
+    Scatters the long complete dataset into an (n, V) array.
+
+    Args:
+        subjects: Subject IDs in the row order of the cube.
+        visits: Visit names in the column order wanted (e.g. WEEK2 ... WEEK56).
+        path: Long complete data; defaults to 'data_complete.csv'.
+        subject, visit, value: Key and value columns of the long data.
+
+    Returns:
+        A float64 array of shape (len(subjects), len(visits)), NaN where the
+        long data has no record.
+    """
+    if path is None:
+        path = os.path.join(DATA_DIR, "data_complete.csv")
+    long = load_table(path, columns=[subject, visit, value])
+    rows = pd.Index(subjects).get_indexer(long[subject])
+    cols = pd.Index(visits).get_indexer(long[visit])
+    keep = (rows >= 0) & (cols >= 0)
+    truth = np.full((len(subjects), len(visits)), np.nan)
+    truth[rows[keep], cols[keep]] = np.asarray(long[value], dtype=np.float64)[keep]
+    return truth
+
+
+def imputation_metrics(cube, truth, mask, visits, block=16):
+    """
+    MAE, MSE and mean relative absolute error of the imputed values.
+
+    Args:
+        cube: ImputationCube (or array of shape (M, n, p)) with completed data.
+        truth: (n, V) gold-standard values of the visits.
+        mask: (n, V) bool, True for the cells that were imputed.
+        visits: Names (with cube.columns) or column indices of the V visits.
+        block: Number of imputations reduced at a time.
+
+    Returns:
+        A dictionary with, as in comparison.R,
+            'mean_abs', 'mean_sqr', 'mean_r': arrays of shape (M, V) per
+            imputation and visit,
+            'mae', 'mse', 'mrae': their means over imputations, shape (V,),
+            'count': number of imputed cells per visit.
+    """
+    columns = getattr(cube, "columns", None)
+    vcols = [columns.index(v) if isinstance(v, str) else v for v in visits]
+    weight = np.asarray(mask, dtype=np.float64)
+    count = weight.sum(axis=0)
+    truth = np.where(weight > 0, truth, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(weight > 0, 1.0 / np.abs(truth), 0.0)
+        per_cell = 1.0 / count
+
+    nimpute = cube.shape[0]
+    sums = np.empty((3, nimpute, len(vcols)))
+    for start in range(0, nimpute, block):
+        stop = min(start + block, nimpute)
+        diff = np.asarray(cube[start:stop], dtype=np.float64)[:, :, vcols] - truth
+        diff *= weight
+        sums[0, start:stop] = np.abs(diff).sum(axis=1)
+        sums[1, start:stop] = np.einsum("mnv,mnv->mv", diff, diff)
+        sums[2, start:stop] = np.einsum("mnv,nv->mv", np.abs(diff), scale)
+    mean_abs, mean_sqr, mean_r = sums * per_cell
+    return {
+        "mean_abs": mean_abs,
+        "mean_sqr": mean_sqr,
+        "mean_r": mean_r,
+        "mae": mean_abs.mean(axis=0),
+        "mse": mean_sqr.mean(axis=0),
+        "mrae": mean_r.mean(axis=0),
+        "count": count.astype(np.int64),
+    }
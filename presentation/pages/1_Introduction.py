@@ -1,61 +1,9 @@
 import streamlit as st
 from utils import create_navigation_buttons
+from appcache import inject_css
 
 st.set_page_config(layout="wide")
-# Custom CSS for larger font size
-st.markdown("""
-<style>
-    /* Global font size increase for all text */
-    body {
-        font-size: 1.5em; /* Base font size. You can adjust this value (e.g., 1.1em, 1.2em, 1.3em) */
-        line-height: 1; /* Improve readability with more line spacing */
-    }
-
-    /* Adjust specific Streamlit elements to inherit or have slightly different sizes */
-    .stMarkdown, .stText, .stAlert, .stInfo, .stSuccess, .stWarning {
-        font-size: inherit; /* Inherit the global font size */
-    }
-
-    /* Headings */
-    h1 {
-        font-size: 2.2em !important; /* For main titles */
-        line-height: 1 !important;
-    }
-    h2 {
-        font-size: 2em !important; /* For section titles */
-    }
-    h3 {
-        font-size: 1.8em !important; /* For sub-sections */
-    }
-    h4 {
-        font-size: 1.5em !important; /* For sub-sections */
-    }        
-    p {
-        font-size: 1.2em !important;
-        line-height: 1.5em !important;
-    }
-    li {
-        font-size: 1.2em !important;
-        line-height: 1.5em !important;
-    }
-
-    /* Code blocks - often benefit from being slightly smaller than body text for readability of code itself */
-    pre, code {
-        font-size: 0.95em !important; /* Slightly smaller than body text for code snippets */
-        line-height: 1;
-    }
-
-    /* For the sidebar navigation links */
-    .st-emotion-cache-1f8d951 a { /* Target sidebar links */
-        font-size: 1.1em; /* Make sidebar links slightly larger */
-    }
-    .st-emotion-cache-vk33as { /* Target sidebar text elements */
-        font-size: 1.1em;
-    }
-
-
-</style>
-""", unsafe_allow_html=True) # Important: This allows injecting HTML/CSS
+inject_css()
 
 create_navigation_buttons(__file__, 'upper')
 st.markdown("---") # Add a separator below the buttons
@@ -1,62 +1,10 @@
 import streamlit as st
 from utils import create_navigation_buttons
+from appcache import image, inject_css
 from streamlit_mermaid import st_mermaid
 
 st.set_page_config(layout="wide")
-# Custom CSS for larger font size
-st.markdown("""
-<style>
-    /* Global font size increase for all text */
-    body {
-        font-size: 1.5em; /* Base font size. You can adjust this value (e.g., 1.1em, 1.2em, 1.3em) */
-        line-height: 1; /* Improve readability with more line spacing */
-    }
-
-    /* Adjust specific Streamlit elements to inherit or have slightly different sizes */
-    .stMarkdown, .stText, .stAlert, .stInfo, .stSuccess, .stWarning {
-        font-size: inherit; /* Inherit the global font size */
-    }
-
-    /* Headings */
-    h1 {
-        font-size: 2.2em !important; /* For main titles */
-        line-height: 1 !important;
-    }
-    h2 {
-        font-size: 2em !important; /* For section titles */
-    }
-    h3 {
-        font-size: 1.8em !important; /* For sub-sections */
-    }
-    h4 {
-        font-size: 1.5em !important; /* For sub-sections */
-    }        
-    p {
-        font-size: 1.2em !important;
-        line-height: 1.5em !important;
-    }
-    li {
-        font-size: 1.2em !important;
-        line-height: 1.5em !important;
-    }
-
-    /* Code blocks - often benefit from being slightly smaller than body text for readability of code itself */
-    pre, code {
-        font-size: 0.95em !important; /* Slightly smaller than body text for code snippets */
-        line-height: 1;
-    }
-
-    /* For the sidebar navigation links */
-    .st-emotion-cache-1f8d951 a { /* Target sidebar links */
-        font-size: 1.1em; /* Make sidebar links slightly larger */
-    }
-    .st-emotion-cache-vk33as { /* Target sidebar text elements */
-        font-size: 1.1em;
-    }
-
-
-</style>
-""", unsafe_allow_html=True) # Important: This allows injecting HTML/CSS
+inject_css()
 
 create_navigation_buttons(__file__, 'upper')
 st.markdown("---") # Add a separator below the buttons
@@ -80,7 +28,7 @@ with col1:
         **Why use it?** MCMC is especially suitable in situations where data are missing in an arbitrary (non-monotone) fashion and the relationships among variables are complex, as it preserves multivariate structures and correlations.
         """)
         st.subheader("MCMC Conceptual Diagram")
-        st.image(
+        image(
             "fig/MCMC process.svg",
             caption="Conceptual illustration of MCMC sampling",
             use_container_width=True
@@ -95,7 +43,7 @@ with col2:
         **Why use it?** It's computationally efficient and leverages the ordered nature of longitudinal or follow-up data, explicitly handling the monotone structure of missingness.
         """)
         st.subheader("Monotone Regression Conceptual Diagram")
-        st.image(
+        image(
             "fig/Monotone regression.svg",
             caption="Conceptual illustration of Monotone Regression",
             use_container_width=True
@@ -115,7 +63,7 @@ with col3:
         **How it's used here:** After handling missing data through multiple imputation, ANCOVA is applied separately to each imputed dataset. This helps to improve the precision of treatment effect estimates and ensures more robust results.
         """)
         st.subheader("ANCOVA Key Points Diagram")
-        st.image(
+        image(
             "fig/ANCOVA.svg",
             caption="Key Points of ANCOVA",
             use_container_width=True
@@ -130,7 +78,7 @@ with col4:
         **Why is it crucial?** Following separate analyses on each imputed dataset, Rubin’s Rule aggregates the estimates to produce valid statistical inferences that account for uncertainty due to missing data. This is essential for obtaining correct confidence intervals and p-values in multiple imputation analyses.
         """)
         st.subheader("Rubin's Rule Pooling Conceptual Diagram")
-        st.image(
+        image(
             "fig/Rubin's Rule.svg",
             caption="Conceptual illustration of Rubin's Rule Pooling",
             use_container_width=True
@@ -1,60 +1,11 @@
+import numpy as np
+import pandas as pd
 import streamlit as st
 from utils import create_navigation_buttons
+from appcache import burnin_diagnostics, input_digest, inject_css, mcmc_draw, wide_data
 
 st.set_page_config(layout="wide")
-st.markdown("""
-<style>
-/* Global font size increase for all text */
-body {
-font-size: 1.5em; /* Base font size. You can adjust this value (e.g., 1.1em, 1.2em, 1.3em) */
-line-height: 1; /* Improve readability with more line spacing */
-}
-
-/* Adjust specific Streamlit elements to inherit or have slightly different sizes */
-.stMarkdown, .stText, .stAlert, .stInfo, .stSuccess, .stWarning {
-font-size: inherit; /* Inherit the global font size */
-}
-
-/* Headings */
-h1 {
-font-size: 2.2em !important; /* For main titles */
-line-height: 1 !important;
-}
-h2 {
-font-size: 2em !important; /* For section titles */
-}
-h3 {
-font-size: 1.8em !important; /* For sub-sections */
-}
-h4 {
-font-size: 1.5em !important; /* For sub-sections */
-}
-p {
-font-size: 1.2em !important;
-line-height: 1.5em !important;
-}
-li {
-font-size: 1.2em !important;
-line-height: 1.5em !important;
-}
-
-/* Code blocks - often benefit from being slightly smaller than body text for readability of code itself */
-pre, code {
-font-size: 0.85em !important; /* Slightly smaller than body text for code snippets */
-line-height: 1;
-}
-
-/* For the sidebar navigation links */
-.st-emotion-cache-1f8d951 a { /* Target sidebar links */
-font-size: 1.1em; /* Make sidebar links slightly larger */
-}
-.st-emotion-cache-vk33as { /* Target sidebar text elements */
-font-size: 1.1em;
-}
-
-
-</style>
-""", unsafe_allow_html=True) # Important: This allows injecting HTML/CSS
+inject_css()
 
 create_navigation_buttons(__file__, 'upper')
 st.markdown("---") # Add a separator below the buttons
@@ -98,6 +49,9 @@ prelim.norm.new <- function (x) {
   ...
 }
     """, language="r")
+    st.markdown("""
+A double still only represents integers exactly up to 2^53, so this key breaks down beyond 53 variables. The Python engine (`patterns.py`) packs each row's missingness into 64-bit words instead, one bit per variable, which keeps the pattern key exact for any number of visits.
+    """)
 
 with st.expander("**Core MCMC function**"):
     st.markdown("""
@@ -171,6 +125,68 @@ This code `all_mono_one_time[j, (last_num+1):ncol(data)] <- "is.na<-"(all_mono_o
                 transforming the dataset into a **monotone missing** data pattern in preparation for subsequent monotone regression imputation.
 """)
 
+with st.expander("**Live Run: Monotone Data Augmentation on the Dummy Data**"):
+    st.markdown("""
+The same I-step/P-step chain is also available in Python (`mcmc.py`), where all subjects sharing a missing pattern are imputed with one matrix operation.
+                Choose the number of iterations and the seed, and the chain is run on the 500-subject dummy dataset.
+""")
+    col_steps, col_seed = st.columns(2)
+    mcmc_steps = col_steps.slider("Number of MCMC iterations", min_value=10, max_value=300, value=100, step=10)
+    mcmc_seed = col_seed.number_input("Random seed", value=13141, step=1)
+    if st.button("Run MCMC", key="run-mcmc"):
+        digest = input_digest()
+        _, x, columns = wide_data(digest=digest)
+        draw = mcmc_draw(mcmc_steps, int(mcmc_seed), digest=digest)
+
+        col_patt, col_time = st.columns(2)
+        col_patt.metric("Missing patterns", draw["npatt"])
+        col_time.metric("Run time (EM + MCMC)", f"{draw['elapsed']:.2f} s")
+        means = pd.DataFrame({
+            "Observed mean": np.nanmean(x, axis=0),
+            "Posterior draw of the mean": draw["mu"],
+        }, index=columns).iloc[4:]
+        st.line_chart(means)
+        st.caption("Mean change from baseline by visit: observed data vs. the final MCMC draw.")
+
+with st.expander("**Live Run: Convergence Diagnostics and Automatic Burn-in**"):
+    st.markdown("""
+`mda_r` only prints `1...2...3...`, and the burn-in is fixed at the SAS default of 200 iterations, so it is not visible whether the chain has converged.
+                In Python, several chains are run side by side from the EM estimate and a few summaries of the parameters are traced after every iteration:
+                the mean at the last visit, the mean of each treatment arm at the last visit and the **worst linear function** (WLF, the direction in which EM converged most slowly, as in PROC MI).
+                Every 50 iterations, the split-$\\hat{R}$ and the effective sample size (ESS) of the latest half of the iterations are checked,
+                and the burn-in stops as soon as every $\\hat{R}$ is below the threshold and every ESS is large enough.
+""")
+    col_chains, col_rhat, col_ess, col_seed = st.columns(4)
+    nchains = col_chains.slider("Number of chains", min_value=2, max_value=8, value=4)
+    rhat_max = col_rhat.select_slider("R-hat threshold", options=[1.001, 1.005, 1.01, 1.05, 1.1], value=1.01)
+    min_ess = col_ess.slider("Minimum ESS", min_value=100, max_value=2000, value=400, step=100)
+    chain_seed = col_seed.number_input("Random seed", value=13141, step=1, key="burnin-seed")
+    if st.button("Run chains", key="run-burnin"):
+        st.session_state["burnin-run"] = True
+    # Kept after the click so that choosing another traced summary does not hide the results
+    if st.session_state.get("burnin-run"):
+        diag = burnin_diagnostics(nchains, int(chain_seed), rhat_max, min_ess, digest=input_digest())
+
+        col_iter, col_conv, col_time = st.columns(3)
+        col_iter.metric("Burn-in iterations", diag["nbiter"], delta=f"{diag['nbiter'] - 200:+d} vs. NBITER=200",
+                        delta_color="off")
+        col_conv.metric("Converged", "Yes" if diag["converged"] else "No")
+        col_time.metric("Run time (all chains)", f"{diag['elapsed']:.2f} s")
+
+        component = st.selectbox("Traced summary", diag["names"], key="burnin-component")
+        k = diag["names"].index(component)
+        trace = pd.DataFrame(diag["trace"][:, :, k].T, columns=[f"Chain {c + 1}" for c in range(nchains)])
+        trace.index = trace.index + 1
+        st.line_chart(trace)
+        st.caption(f"Trace plot of {component} in every chain. The second half of the iterations is the window of the final check.")
+
+        checks = diag["checks"]
+        col_r, col_e = st.columns(2)
+        col_r.markdown("**Split-$\\hat{R}$ at every check**")
+        col_r.line_chart(pd.DataFrame(checks["rhat"], index=checks["iteration"], columns=diag["names"]))
+        col_e.markdown("**Effective sample size at every check**")
+        col_e.line_chart(pd.DataFrame(checks["ess"], index=checks["iteration"], columns=diag["names"]))
+
 st.subheader("4.2 Monotone Regression Imputation in R")
 st.markdown("""
 To perform the monotone regression imputation step in R, we developed a function, 
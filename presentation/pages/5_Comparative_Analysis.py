@@ -1,63 +1,13 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import altair as alt
 from utils import create_navigation_buttons # Assuming this utility is available
 from streamlit_mermaid import st_mermaid
+from appcache import GOLD_PATH, edf_sensitivity, image, imputation_accuracy, inject_css, input_digest, mi_ancova
 
 st.set_page_config(layout="wide")
-st.markdown("""
-<style>
-/* Global font size increase for all text */
-body {
-font-size: 1.5em; /* Base font size. You can adjust this value (e.g., 1.1em, 1.2em, 1.3em) */
-line-height: 1; /* Improve readability with more line spacing */
-}
-
-/* Adjust specific Streamlit elements to inherit or have slightly different sizes */
-.stMarkdown, .stText, .stAlert, .stInfo, .stSuccess, .stWarning {
-font-size: inherit; /* Inherit the global font size */
-}
-
-/* Headings */
-h1 {
-font-size: 2.2em !important; /* For main titles */
-line-height: 1 !important;
-}
-h2 {
-font-size: 2em !important; /* For section titles */
-}
-h3 {
-font-size: 1.8em !important; /* For sub-sections */
-}
-h4 {
-font-size: 1.5em !important; /* For sub-sections */
-}
-p {
-font-size: 1.2em !important;
-line-height: 1.5em !important;
-}
-li {
-font-size: 1.2em !important;
-line-height: 1.5em !important;
-}
-
-/* Code blocks - often benefit from being slightly smaller than body text for readability of code itself */
-pre, code {
-font-size: 0.85em !important; /* Slightly smaller than body text for code snippets */
-line-height: 1;
-}
-
-/* For the sidebar navigation links */
-.st-emotion-cache-1f8d951 a { /* Target sidebar links */
-font-size: 1.1em; /* Make sidebar links slightly larger */
-}
-.st-emotion-cache-vk33as { /* Target sidebar text elements */
-font-size: 1.1em;
-}
-
-
-</style>
-""", unsafe_allow_html=True) # Important: This allows injecting HTML/CSS
+inject_css()
 
 create_navigation_buttons(__file__, 'upper')
 st.markdown("---") # Add a separator below the buttons
@@ -120,7 +70,7 @@ We first performed multiple imputation on the dummy dataset with missing values
             However, noticeable discrepancies were observed in the reported **degrees of freedom (df)**,
             which led to differences in **confidence intervals** and **p-values**.
 """)
-st.image("fig/result compare EDF null.png",
+image("fig/result compare EDF null.png",
          caption="Comparison Results when EDF is Null")
 
 st.markdown("### Interactive: The Impact of Degrees of Freedom (DF)")
@@ -132,33 +82,92 @@ The discrepancy was traced to how "complete-data degrees of freedom" (EDF) are h
 For our dummy data (500 subjects, 7 model parameters), the correct complete-data degrees of freedom should be **500 - 7 = 493**.
 """)
 
-edf_setting = st.radio(
-    "Select SAS EDF Setting (Conceptual)",
-    ("Default (Infinite)", "Corrected (EDF=493)"),
-    index=1, # Default to corrected as it's the right way
-    help="Observe how the conceptual P-value and Confidence Interval change based on the EDF setting."
+digest = input_digest()
+visits, _, _, model_df = mi_ancova(digest=digest)
+edf_grid, sweep = edf_sensitivity(digest=digest)
+edf_options = [int(g) if np.isfinite(g) else "Infinite" for g in edf_grid]
+
+col_setting, col_visit = st.columns([2, 1])
+edf_choice = col_setting.select_slider(
+    "Select SAS EDF Setting",
+    options=edf_options,
+    value=model_df, # Default to corrected as it's the right way
+    help="Observe how the P-value and Confidence Interval change based on the EDF setting. "
+         "'Infinite' is the SAS default."
 )
+selected_visit = col_visit.selectbox("Visit", visits, index=len(visits) - 1)
 
-col_df, col_p, col_ci = st.columns(3)
+j = edf_options.index(edf_choice)
+edf = edf_grid[j]
+edf_label = "EDF=Inf" if np.isinf(edf) else f"EDF={int(edf)}"
+pooled = {key: values[j] for key, values in sweep.items()}
+k = visits.index(selected_visit)
 
-if edf_setting == "Default (Infinite)":
-    p_value = "1.61024E-36" # Conceptual value for demonstration
-    df_value = "293.46043166"
-    ci_range = "[-1.221521347, -0.930615437]" # Conceptual value
-    col_p.metric("Conceptual P-value (EDF=Inf)", p_value)
-    col_ci.metric("Conceptual CI (EDF=Inf)", ci_range)
-    col_df.metric("Conceptual DF (EDF=Inf)", df_value)
+col_df, col_p, col_ci = st.columns(3)
+col_p.metric(f"P-value ({edf_label})", f"{pooled['p'][k, 0]:.6E}")
+col_ci.metric(f"CI ({edf_label})", f"[{pooled['lower'][k, 0]:.9f}, {pooled['upper'][k, 0]:.9f}]")
+col_df.metric(f"DF ({edf_label})", f"{pooled['df'][k, 0]:.8f}")
+if np.isinf(edf):
     st.warning("With default infinite DF in SAS, confidence intervals and p-values has a little difference.")
-else: # Corrected (EDF=493)
-    p_value = "2.285806E-28" # Conceptual value
-    df_value = "120.97"
-    ci_range = "[-1.222385109, -0.929751676]" # Conceptual value
-    col_p.metric("Conceptual P-value (EDF=493)", p_value)
-    col_ci.metric("Conceptual CI (EDF=493)", ci_range)
-    col_df.metric("Conceptual DF (EDF=493)", df_value)
+elif edf == model_df:
     st.success("By correctly specifying EDF, R and SAS yield fully consistent results for ANCOVA with Rubin's Rule pooling.")
+else:
+    st.info(f"EDF={int(edf)} is neither the SAS default nor the complete-data df of the model ({model_df}).")
 
-st.image("fig/result compare EDF 493.png",
+st.markdown("#### EDF Sensitivity")
+st.markdown("""
+The curves show the Barnard-Rubin df, the CI width and the p-value of the selected visit over the whole EDF range;
+            the heatmap shows the chosen quantity for all visits. The dashed line marks the selected EDF.
+""")
+finite = np.isfinite(edf_grid)
+sens = pd.DataFrame({
+    "EDF": edf_grid[finite],
+    "DF": sweep["df"][finite, k, 0],
+    "CI width": (sweep["upper"] - sweep["lower"])[finite, k, 0],
+    "P-value": sweep["p"][finite, k, 0],
+})
+edf_rule = alt.Chart(pd.DataFrame({"EDF": [edf if np.isfinite(edf) else edf_grid[finite][-1]]})).mark_rule(
+    strokeDash=[4, 4], color="gray").encode(x="EDF:Q")
+for col, quantity in zip(st.columns(3), ("DF", "CI width", "P-value")):
+    curve = alt.Chart(sens).mark_line().encode(
+        x=alt.X("EDF:Q", scale=alt.Scale(type="log")),
+        y=alt.Y(f"{quantity}:Q", scale=alt.Scale(zero=False)),
+        tooltip=["EDF", quantity],
+    )
+    col.altair_chart((curve + edf_rule).properties(height=220, title=f"{quantity} ({selected_visit})"),
+                     use_container_width=True)
+
+heat_quantity = st.radio("Heatmap quantity", ("DF", "CI width", "P-value"), horizontal=True)
+heat_values = {"DF": sweep["df"], "CI width": sweep["upper"] - sweep["lower"], "P-value": sweep["p"]}[heat_quantity]
+edges = np.sqrt(edf_grid[finite][:-1] * edf_grid[finite][1:])
+heat = pd.DataFrame({
+    "Visit": np.tile(visits, finite.sum()),
+    "EDF from": np.repeat(np.concatenate([[edf_grid[0]], edges]), len(visits)),
+    "EDF to": np.repeat(np.concatenate([edges, [edf_grid[finite][-1]]]), len(visits)),
+    heat_quantity: heat_values[finite, :, 0].ravel(),
+})
+heatmap = alt.Chart(heat).mark_rect().encode(
+    x=alt.X("EDF from:Q", scale=alt.Scale(type="log"), title="EDF"),
+    x2="EDF to:Q",
+    y=alt.Y("Visit:N", sort=visits),
+    color=alt.Color(f"{heat_quantity}:Q", scale=alt.Scale(scheme="viridis")),
+    tooltip=["Visit", "EDF from", heat_quantity],
+)
+st.altair_chart((heatmap + edf_rule).properties(height=500), use_container_width=True)
+
+with st.expander("Pooled results for all visits"):
+    st.dataframe(pd.DataFrame({
+        "Estimate": pooled["estimate"][:, 0],
+        "StdErr": pooled["se"][:, 0],
+        "DF": pooled["df"][:, 0],
+        "LCLMean": pooled["lower"][:, 0],
+        "UCLMean": pooled["upper"][:, 0],
+        "tValue": pooled["t"][:, 0],
+        "Probt": pooled["p"][:, 0],
+    }, index=visits))
+    st.caption("Results are computed live from 100 imputations of the dummy data (Python implementation of the R workflow).")
+
+image("fig/result compare EDF 493.png",
          caption="Comparison Results when EDF = 493")
 
 st.markdown("---")
@@ -169,11 +178,11 @@ We independently applied the MCMC and monotone regression imputation workflow in
 
 st.markdown("#### Imputation Results Comparison")
 st.markdown("""
-Adjust the slider below to observe how MAE and MSE vary over different visit timepoints for R and SAS.
+Select a metric below to observe how MAE and MSE vary over different visit timepoints for R and SAS. The Python series is computed live from the imputed data.
 """)
 
-num_visits = 28 # Based on paper
-visit_points = np.arange(1, num_visits + 1)
+# Reference results of the R and SAS runs in the paper (comparison.R)
+visit_points = np.arange(2, 57, 2)
 mae_r = [0.5013491, 0.5682386, 0.5510682, 0.5893913, 0.5832965, 0.5750889, 0.5827270,
 0.5136055, 0.5577019, 0.5922436, 0.5542919, 0.5999328, 0.6015073, 0.5960374,
 0.5540343, 0.5797067, 0.5916288, 0.5693115, 0.5888431, 0.5835375, 0.5811179,
@@ -191,29 +200,42 @@ mse_sas = [0.4299428, 0.5480918, 0.5022097, 0.5303119, 0.5560830, 0.5343936, 0.5
 0.4773675, 0.5273627, 0.5556925, 0.5125390, 0.5429138, 0.5326726, 0.5478360,
 0.5698932, 0.5831032, 0.4906064, 0.5409541, 0.6076947, 0.5803675, 0.5691869]
 
+# Live results of the Python implementation on the same dummy data
+accuracy = imputation_accuracy(digest=digest, gold_digest=input_digest(GOLD_PATH))
+
 df_mae = pd.DataFrame({
     "Visit": visit_points,
     "R (MAE)": mae_r,
-    "SAS (MAE)": mae_sas
+    "SAS (MAE)": mae_sas,
+    "Python (MAE)": accuracy["mae"],
 }).set_index("Visit")
 
 df_mse = pd.DataFrame({
     "Visit": visit_points,
     "R (MSE)": mse_r,
-    "SAS (MSE)": mse_sas
+    "SAS (MSE)": mse_sas,
+    "Python (MSE)": accuracy["mse"],
+}).set_index("Visit")
+
+df_mrae = pd.DataFrame({
+    "Visit": visit_points,
+    "Python (MRAE)": accuracy["mrae"],
 }).set_index("Visit")
 
 metric_choice = st.radio(
     "Select Metric to Visualize",
-    ("Mean Absolute Error (MAE)", "Mean Squared Error (MSE)")
+    ("Mean Absolute Error (MAE)", "Mean Squared Error (MSE)", "Mean Relative Absolute Error (MRAE)")
 )
 
 if metric_choice == "Mean Absolute Error (MAE)":
     st.line_chart(df_mae)
-    st.caption("MAE Comparison between R and SAS.")
-else:
+    st.caption("MAE Comparison between R, SAS and the live Python run.")
+elif metric_choice == "Mean Squared Error (MSE)":
     st.line_chart(df_mse)
-    st.caption("MSE Comparison between R and SAS.")
+    st.caption("MSE Comparison between R, SAS and the live Python run.")
+else:
+    st.line_chart(df_mrae)
+    st.caption("MRAE of the live Python run.")
 
 st.info("R and SAS achieved highly similar imputation performance. The minor differences are largely attributed to inherent randomness and not substantive methodological differences.")
 
@@ -221,7 +243,7 @@ st.markdown("""
 #### Analytical Results (Estimates and CIs) Comparison
 Point estimates and confidence intervals from R and SAS were overall quite close across all visit timepoints. While perfect replication was not possible due to differences in underlying random number generation, the observed differences were minor and primarily attributed to the inherent stochasticity in the imputation process.
 """)
-st.image("fig/ANCOVA_forest.png",
+image("fig/ANCOVA_forest.png",
          caption="Comparison of Estimates and CIs between SAS and R (Your presentation figure goes here)")
 st.error("""
            It is important to note that perfect replication between the two platforms was **not possible** due to differences in their underlying random number generation. 
@@ -0,0 +1,108 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils import create_navigation_buttons
+from appcache import inject_css, input_digest, wide_data
+from dataset import visit_columns
+from pipeline import pooled_ancova, two_step_impute
+import instrument
+
+st.set_page_config(layout="wide")
+inject_css()
+
+create_navigation_buttons(__file__, 'upper')
+st.markdown("---") # Add a separator below the buttons
+
+st.title("7. Performance")
+st.markdown("""
+The Python implementation records the wall time and memory of every stage (pattern preparation, EM, MCMC, monotone regression, ANCOVA and pooling),
+            the MCMC iterations per second and the cache hit rates while it runs.
+            The numbers below are read from these records once per second, so they also show runs started on the other pages.
+""")
+
+
+@st.cache_resource
+def background_run():
+    """
+    The pipeline run started from this page, shared by all sessions.
+    """
+    return {"thread": None, "error": None}
+
+
+def run_pipeline(nimpute, seed, run):
+    try:
+        wide, x, columns = wide_data(digest=input_digest())
+        cube = two_step_impute(x, columns, nimpute=nimpute, seed=seed)
+        pooled_ancova(cube, visit_columns(wide))
+    except Exception as e:
+        run["error"] = str(e)
+
+
+run = background_run()
+running = run["thread"] is not None and run["thread"].is_alive()
+col_m, col_seed, col_button = st.columns([2, 2, 1])
+nimpute = col_m.slider("Number of imputations", min_value=5, max_value=500, value=100, step=5)
+seed = col_seed.number_input("Random seed", value=13141, step=1)
+col_button.markdown("<br>", unsafe_allow_html=True)
+if col_button.button("Run pipeline", disabled=running, use_container_width=True):
+    run["error"] = None
+    run["thread"] = threading.Thread(target=run_pipeline, args=(nimpute, int(seed), run), daemon=True)
+    run["thread"].start()
+if col_button.button("Clear records", use_container_width=True):
+    instrument.RECORDER.reset()
+
+
+@st.fragment(run_every=1.0)
+def live_metrics():
+    snap = instrument.snapshot()
+    events = pd.DataFrame(snap["events"], columns=["stage", "time", "seconds", "rss_mb", "peak_rss_mb"])
+    mcmc = events[events["stage"] == "mcmc"]
+    running_mcmc = [r for r in snap["running"] if r["stage"] == "mcmc"]
+    if running_mcmc:
+        rate = running_mcmc[0]["rate"]
+    elif len(mcmc) and snap["counters"].get("mcmc_iterations"):
+        rate = snap["counters"]["mcmc_iterations"] / mcmc["seconds"].sum()
+    else:
+        rate = np.nan
+    hits = sum(snap["counters"].get(f"{c}_hits", 0) for c in snap["hit_rate"])
+    lookups = hits + sum(snap["counters"].get(f"{c}_misses", 0) for c in snap["hit_rate"])
+
+    col_rate, col_rss, col_peak, col_cache = st.columns(4)
+    col_rate.metric("MCMC iterations / s", "-" if np.isnan(rate) else f"{rate:.1f}")
+    col_rss.metric("Memory (RSS)", f"{snap['rss_mb']:.0f} MB")
+    col_peak.metric("Memory high-water", f"{snap['peak_rss_mb']:.0f} MB")
+    col_cache.metric("Cache hit rate", f"{hits / lookups:.0%}" if lookups else "-")
+
+    for r in snap["running"]:
+        label = f"{r['stage']}: {r['done']}/{r['total']} iterations, {r['elapsed']:.1f} s" if r["total"] \
+            else f"{r['stage']}: {r['elapsed']:.1f} s"
+        st.progress(min(r["done"] / r["total"], 1.0) if r["total"] else 0.0, text=label)
+    if run["error"]:
+        st.error(f"The pipeline run failed: {run['error']}")
+
+    if events.empty:
+        st.info("No stage has run yet in this server process. Start a run above or open the analysis pages.")
+        return
+    summary = events.groupby("stage", sort=False)["seconds"].agg(["count", "mean", "sum", "last"])
+    summary.columns = ["Runs", "Mean (s)", "Total (s)", "Last (s)"]
+    summary["Peak RSS (MB)"] = events.groupby("stage", sort=False)["peak_rss_mb"].max()
+
+    col_table, col_chart = st.columns(2)
+    col_table.dataframe(summary, use_container_width=True)
+    col_chart.bar_chart(summary["Total (s)"])
+    st.caption("Total time per stage. The stages are timed one after another, not nested: "
+               "EM is its own stage and runs before the MCMC stage.")
+    with st.expander("Recent stage runs"):
+        recent = events.tail(200).copy()
+        recent["time"] = pd.to_datetime(recent["time"], unit="s")
+        st.dataframe(recent.iloc[::-1], use_container_width=True)
+    if snap["hit_rate"]:
+        st.markdown("**Cache hit rate by cache:** " + ", ".join(f"`{c}` {r:.0%}" for c, r in snap["hit_rate"].items()))
+
+
+live_metrics()
+
+st.markdown("---") # Add a separator below the buttons
+create_navigation_buttons(__file__, 'lower')
@@ -0,0 +1,134 @@
+# patterns.py
+"""
+Missing-pattern index keyed on bit-packed missingness masks.
+
+prelim.norm.new encodes each row's pattern as r %*% 2^(0:(p-1)) in a double,
+which is only exact up to 53 variables, and sorts the whole data matrix to
+group the rows. Here every row's missingness is packed into 64-bit words
+(one bit per variable), each row's words are viewed as one opaque byte key
+so the rows are grouped by a single vectorized np.unique, and only the
+distinct patterns are put in monotone order.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class PatternIndex:
+    """
+    Pattern bookkeeping for a data matrix with n rows and p variables.
+
+    Patterns are numbered in monotone order: the last variable is the most
+    significant bit of the key, as in prelim.norm.new. Row ranges refer to
+    the rows sorted with 'order'; 'ro' restores the original order.
+    """
+    n: int
+    p: int
+    keys: np.ndarray        # (npatt, nwords) uint64 packed missingness, most significant word first
+    pattern: np.ndarray     # (n,) pattern number of each original row
+    order: np.ndarray       # (n,) original row numbers in pattern-sorted order
+    ro: np.ndarray          # (n,) inverse of order
+    mdpst: np.ndarray       # (npatt,) first sorted row of each pattern
+    nmdp: np.ndarray        # (npatt,) number of rows in each pattern
+    r: np.ndarray           # (npatt, p) observed indicator of each pattern
+    obs_cols: list = field(default_factory=list)  # observed columns of each pattern
+    mis_cols: list = field(default_factory=list)  # missing columns of each pattern
+    last: np.ndarray = None  # (npatt,) 1-based last observed variable, 0 if none
+    sj: np.ndarray = None    # (p,) leading patterns taking part in monotone DA for each variable
+    nmon: np.ndarray = None  # (p,) rows in those patterns
+    layer: np.ndarray = None  # (p,) cross-product layer of each variable
+    nlayer: int = 0
+    dropout: np.ndarray = None  # (n, p) True after each original row's last observed variable
+
+    @property
+    def npatt(self):
+        return len(self.mdpst)
+
+    def rows(self, patt):
+        """
+        Slice of the pattern's rows in the pattern-sorted data.
+        """
+        start = self.mdpst[patt]
+        return slice(start, start + self.nmdp[patt])
+
+
+def pack_missing(miss):
+    """
+    Packs a boolean (n, p) missingness matrix into (n, ceil(p/64)) uint64
+    words. The last variable is the highest bit of the first word, so that
+    comparing rows word by word orders them like r %*% 2^(0:(p-1)).
+    """
+    n, p = miss.shape
+    nwords = max(1, -(-p // 64))
+    padded = np.zeros((n, nwords * 64), dtype=bool)
+    padded[:, nwords * 64 - p:] = miss[:, ::-1]
+    packed = np.packbits(padded, axis=1)
+    return packed.view(">u8").astype(np.uint64).reshape(n, nwords)
+
+
+def build_pattern_index(x):
+    """
+    Builds the pattern index of x with vectorized passes over the packed rows.
+
+    Args:
+        x: Numeric array of shape (n, p) with NaN for missing values.
+
+    Returns:
+        A PatternIndex.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[:, None]
+    n, p = x.shape
+    words = pack_missing(np.isnan(x))
+
+    # Group rows on their packed words viewed as one void scalar each; the byte order of
+    # that view is not numeric, so only the distinct keys are then ranked in monotone order
+    void = np.ascontiguousarray(words).view(np.dtype((np.void, words.itemsize * words.shape[1]))).ravel()
+    _, first, inverse = np.unique(void, return_index=True, return_inverse=True)
+    keys = words[first]
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[np.lexsort(keys.T[::-1])] = np.arange(len(keys))
+    pattern = rank[inverse.ravel()]
+    keys = keys[np.argsort(rank)]
+
+    # Few patterns fit in 16 bits, where numpy's stable sort is a linear radix sort
+    sort_key = pattern.astype(np.uint16) if len(keys) <= np.iinfo(np.uint16).max else pattern
+    order = np.argsort(sort_key, kind="stable")
+    ro = np.empty(n, dtype=np.int64)
+    ro[order] = np.arange(n)
+    nmdp = np.bincount(pattern, minlength=len(keys))
+    mdpst = np.r_[0, np.cumsum(nmdp)[:-1]]
+    r = ~np.isnan(x[order[mdpst]])
+
+    index = PatternIndex(
+        n=n, p=p, keys=keys, pattern=pattern, order=order, ro=ro,
+        mdpst=mdpst, nmdp=nmdp, r=r,
+        obs_cols=[np.flatnonzero(row) for row in r],
+        mis_cols=[np.flatnonzero(~row) for row in r],
+    )
+    index.last, index.sj, index.nmon, index.layer, index.nlayer = monotone_layers(r, nmdp)
+    index.dropout = np.arange(p)[None, :] >= index.last[pattern][:, None]
+    return index
+
+
+def monotone_layers(observed, nmdp):
+    """
+    Computes the monotone bookkeeping of the sorted patterns
+    (the Fortran routines lasts, sjn, nmons and layers).
+
+    last[patt] is the (1-based) last observed variable of a pattern,
+    sj[j] the number of leading patterns in which variable j+1 takes part in
+    monotone data augmentation, nmon[j] the number of rows in those patterns
+    and layer[j] the layer of cross-product statistics variable j+1 uses.
+    """
+    npatt, p = observed.shape
+    any_obs = observed.any(axis=1)
+    last = np.where(any_obs, p - np.argmax(observed[:, ::-1], axis=1), 0)
+    sj = (last[None, :] >= np.arange(1, p + 1)[:, None]).sum(axis=1)
+    nmon = np.r_[0, np.cumsum(nmdp)][sj]
+    new_layer = (sj > np.r_[sj[1:], 0]) & (sj > 0)
+    layer = np.cumsum(new_layer[::-1])[::-1] * (sj > 0)
+    nlayer = int(new_layer.sum())
+    return last, sj, nmon, layer, nlayer
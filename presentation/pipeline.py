@@ -0,0 +1,100 @@
+# pipeline.py
+"""
+The complete workflow of imputation.R and ANCOVA.R in Python:
+MCMC to a monotone pattern (step1), monotone regression (step2),
+ANCOVA per imputation and visit, and Rubin's rule pooling.
+"""
+import numpy as np
+
+from ancova import ancova
+from cube import create_cube
+from dataset import COVARIATE_COLS
+from mcmc import EM_CACHE_DIR, em_norm, iter_imputations, mcmc_impute, prelim_norm
+from monotone import monotone_reg
+from pooling import RubinAccumulator, rubin_pool
+
+# Seeds used in imputation.R
+MCMC_SEED = 13141
+REG_SEED = 23424
+
+
+def two_step_impute(data, columns, nimpute=100, emmaxits=200, maxits=100, seed=MCMC_SEED, reg_seed=REG_SEED,
+                    covariates=COVARIATE_COLS, out=None, cache_dir=EM_CACHE_DIR):
+    """
+    Runs step1 and step2 of imputation.R and returns the completed
+    ImputationCube of shape (nimpute, n, p). cache_dir is the EM estimate
+    cache of em_norm; None disables it.
+    """
+    cube = mcmc_impute(data, nimpute, emmaxits=emmaxits, maxits=maxits, seed=seed, out=out, columns=columns,
+                       cache_dir=cache_dir)
+    return monotone_reg(cube, covariates, seed=reg_seed)
+
+
+def pooled_ancova(cube, visits, edf=np.inf, level=0.95):
+    """
+    ANCOVA of every imputation and visit followed by Rubin's rule pooling of
+    the treatment-vs-control contrasts.
+
+    Returns:
+        A tuple (fits, pooled) with the per-imputation results of ancova and
+        the pooled arrays of rubin_pool, shaped (visits, contrasts).
+    """
+    fits = ancova(cube, visits)
+    pooled = rubin_pool(fits["estimate"], fits["se"] ** 2, edf=edf, level=level)
+    return fits, pooled
+
+
+def stream_mi_ancova(data, columns, visits, nbiter=200, niter=100, emmaxits=200, seed=MCMC_SEED, reg_seed=REG_SEED,
+                     covariates=COVARIATE_COLS):
+    """
+    Imputes, analyses and pools one imputation at a time. Each completed
+    dataset is dropped as soon as its ANCOVA is added to the running
+    Rubin's rule accumulator, so memory does not grow with M.
+
+    Yields:
+        (accumulator, fit) after every imputation, where fit is the ancova
+        result of that imputation. Stop iterating to stop imputing.
+    """
+    s = prelim_norm(data)
+    thetahat = em_norm(s, maxits=emmaxits)
+    reg_rng = np.random.default_rng(reg_seed)
+    accumulator = None
+    for x in iter_imputations(s, thetahat, nbiter=nbiter, niter=niter, rng=seed):
+        cube = create_cube(1, s["n"], s["p"], columns)
+        cube.write(0, x)
+        monotone_reg(cube, covariates, seed=reg_rng)
+        fit = ancova(cube, visits)
+        if accumulator is None:
+            accumulator = RubinAccumulator(fit["estimate"].shape[1:])
+        accumulator.update(fit["estimate"][0], fit["se"][0] ** 2)
+        yield accumulator, fit
+
+
+def adaptive_mi_ancova(data, columns, visits, est_tol=0.01, p_tol=0.001, m_min=5, m_max=100, edf=None, **kwargs):
+    """
+    Keeps imputing and analysing until the Monte Carlo standard errors of
+    the pooled estimate and of its p-value are below est_tol and p_tol for
+    every visit and contrast, with at least m_min and at most m_max
+    imputations. Other arguments are passed to stream_mi_ancova.
+
+    Args:
+        edf: Complete-data df for pooling; defaults to the ANCOVA residual df.
+
+    Returns:
+        A dictionary with 'm' (imputations used), 'converged', 'pooled'
+        (rubin_pool arrays), 'mc_error' and 'p_mc_error'.
+    """
+    for accumulator, fit in stream_mi_ancova(data, columns, visits, **kwargs):
+        pool_edf = fit["df"][0][:, None] if edf is None else edf
+        mc_error = accumulator.mc_error()
+        p_mc_error = accumulator.p_mc_error(pool_edf)
+        converged = bool(np.all(mc_error < est_tol) and np.all(p_mc_error < p_tol))
+        if accumulator.m >= m_max or (accumulator.m >= m_min and converged):
+            break
+    return {
+        "m": accumulator.m,
+        "converged": converged,
+        "pooled": accumulator.pooled(pool_edf),
+        "mc_error": mc_error,
+        "p_mc_error": p_mc_error,
+    }
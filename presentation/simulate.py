@@ -0,0 +1,148 @@
+# simulate.py
+"""
+Vectorized generator for dummy trials following generate_dummy.R.
+
+generate_dummy.R builds the long dataset and then creates the missing
+values with one filter() per subject, which is quadratic in the number of
+subjects. Here every quantity is drawn for all subjects of a chunk at once
+and chunks are written as columnar .npz files, so a 100k-subject trial is
+generated with a fixed memory budget. The model is the same (coefficients,
+0-10 score limits, 50/30/20 missing pattern mix); R's random streams are
+not reproduced.
+"""
+import json
+import os
+
+import numpy as np
+
+from dataset import COVARIATE_COLS
+
+VISITS = np.arange(2, 57, 2)
+
+# Proportions and coefficients of generate_dummy.R
+TRT_PROB = (0.45, 0.55)
+REGION_PROB = (0.4, 0.3, 0.2, 0.1)
+BMI_PROB = (0.8, 0.2)
+COEF_VISIT = 0.03
+COEF_TRT = 1.0
+COEF_REGION = np.array([0.0, 0.5, -0.4, 0.2])
+COEF_BMI = 0.8
+COEF_BASELINE = 0.7
+ERROR_SD = 0.5
+PATTERN_MIX = (0.5, 0.3, 0.2)  # all observed, monotone, monotone + intermittent
+
+
+def simulate_trial(n_subj=500, visits=VISITS, seed=89757, first_id=1, pattern_mix=PATTERN_MIX):
+    """
+    Simulates one block of subjects in wide format.
+
+    Args:
+        n_subj: Number of subjects.
+        visits: Post-baseline visit weeks.
+        seed: Random seed or numpy Generator.
+        first_id: Subject number of the first subject (for chunked output).
+        pattern_mix: Proportions of subjects with all visits observed, with
+                     monotone missing data and with monotone plus
+                     intermittent missing data.
+
+    Returns:
+        A dictionary of columns: 'SUBJID' (subject numbers), 'TRT01PN',
+        'REGIONN', 'BLBMIG1N', 'BASE', 'DCTFL' (True if the subject has
+        missing values), 'CHG_COMPLETE' (n_subj, visits) without missing
+        values and 'CHG' with the simulated missingness.
+    """
+    rng = np.random.default_rng(seed)
+    visits = np.asarray(visits)
+    nvisit = len(visits)
+
+    region = rng.choice(np.arange(1, 5), size=n_subj, p=REGION_PROB)
+    trt = rng.choice(np.arange(1, 3), size=n_subj, p=TRT_PROB)
+    bmi = rng.choice(np.arange(1, 3), size=n_subj, p=BMI_PROB)
+    base = rng.uniform(5, 7, size=n_subj)
+
+    mean = (COEF_BASELINE * base + COEF_TRT * (trt == 2) + COEF_REGION[region - 1] + COEF_BMI * (bmi == 2))
+    aval = mean[:, None] + COEF_VISIT * visits[None, :] + rng.normal(0, ERROR_SD, size=(n_subj, nvisit))
+    aval = np.clip(aval, 0, 10)
+    chg_complete = aval - base[:, None]
+
+    # Assign the missing-data type of every subject with exact proportions
+    n_obs = round(pattern_mix[0] * n_subj)
+    n_mono = round(pattern_mix[1] * n_subj)
+    kind = np.zeros(n_subj, dtype=np.int8)
+    kind[n_obs:n_obs + n_mono] = 1
+    kind[n_obs + n_mono:] = 2
+    kind = rng.permutation(kind)
+
+    # Monotone dropout: the first missing timepoint is drawn among the
+    # 2nd..28th of the 29 timepoints WEEK0..WEEK56, as sample(2:28, 1) in R
+    miss_start = rng.integers(2, nvisit + 1, size=n_subj)
+    timepoint = np.arange(nvisit + 1)[None, :] + 1           # 1-based, including WEEK0
+    missing = (timepoint >= miss_start[:, None]) & (kind[:, None] > 0)
+
+    # Intermittent: 1 to 3 of the still observed timepoints (WEEK0 included)
+    candidates = miss_start - 1
+    n_random = rng.integers(1, np.minimum(candidates, 3) + 1)
+    keys = rng.random((n_subj, nvisit + 1))
+    keys[timepoint >= miss_start[:, None]] = np.inf
+    rank = np.argsort(np.argsort(keys, axis=1), axis=1)
+    missing |= (rank < n_random[:, None]) & (kind[:, None] == 2)
+
+    missing = missing[:, 1:]                                   # WEEK0 is dropped, as in R
+    chg = np.where(missing, np.nan, chg_complete)
+    return {
+        "SUBJID": np.arange(first_id, first_id + n_subj),
+        "TRT01PN": trt.astype(np.int8),
+        "REGIONN": region.astype(np.int8),
+        "BLBMIG1N": bmi.astype(np.int8),
+        "BASE": base,
+        "DCTFL": kind > 0,
+        "CHG_COMPLETE": chg_complete.astype(np.float32),
+        "CHG": chg.astype(np.float32),
+    }
+
+
+def write_trial(path, n_subj, chunk_size=50_000, visits=VISITS, seed=89757):
+    """
+    Simulates a trial chunk by chunk and writes every chunk as a columnar
+    'chunk_XXXXX.npz' file plus a 'meta.json' in the directory path. Memory
+    use is bounded by chunk_size subjects. Each chunk has its own random
+    stream, derived from seed and the chunk number.
+    """
+    os.makedirs(path, exist_ok=True)
+    nchunks = -(-n_subj // chunk_size)
+    files = []
+    for chunk in range(nchunks):
+        start = chunk * chunk_size
+        size = min(chunk_size, n_subj - start)
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+        block = simulate_trial(size, visits=visits, seed=rng, first_id=start + 1)
+        name = f"chunk_{chunk:05d}.npz"
+        np.savez(os.path.join(path, name), **block)
+        files.append(name)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"n_subj": n_subj, "visits": [int(v) for v in visits], "seed": seed, "chunks": files}, f)
+    return path
+
+
+def read_trial(path, columns=None):
+    """
+    Reads a trial written by write_trial, loading only the requested
+    columns from every chunk.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    parts = {}
+    for name in meta["chunks"]:
+        with np.load(os.path.join(path, name)) as chunk:
+            for col in columns or chunk.files:
+                parts.setdefault(col, []).append(chunk[col])
+    return {col: np.concatenate(values) for col, values in parts.items()}
+
+
+def trial_matrix(trial, visits=VISITS, covariates=COVARIATE_COLS):
+    """
+    Numeric matrix for imputation from a simulated trial, laid out like
+    analysis_matrix: the covariates followed by the visit values.
+    """
+    x = np.column_stack([trial[c].astype(np.float64) for c in covariates] + [trial["CHG"].astype(np.float64)])
+    return x, list(covariates) + [f"WEEK{v}" for v in visits]
@@ -0,0 +1,184 @@
+# study.py
+"""
+Simulation study of the imputation workflow over many replicate trials.
+
+The paper compares R and SAS on a single dummy dataset. Here every
+replicate runs generate -> ampute (simulate_trial) -> impute
+(two_step_impute) -> ANCOVA -> pool, in a pool of worker processes. Each
+finished replicate is saved as its own .npz file, so an interrupted study
+resumes with the replicates that are missing. summarize aggregates bias,
+coverage, CI width and runtime by visit, for infinite and model-based EDF.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from ancova import ancova
+from cube import create_cube
+from pipeline import two_step_impute
+from pooling import rubin_pool
+from simulate import COEF_TRT, VISITS, simulate_trial, trial_matrix
+
+# Treatment 1 vs. placebo (2): the simulation adds COEF_TRT to placebo
+TRUE_EFFECT = -COEF_TRT
+
+STUDY_PARAMS = {
+    "n_subj": 500,
+    "nimpute": 20,
+    "emmaxits": 200,
+    "maxits": 100,
+    "seed": 89757,
+}
+
+
+def _replicate_path(path, rep):
+    return os.path.join(path, f"rep_{rep:05d}.npz")
+
+
+def run_replicate(rep, params, path=None):
+    """
+    Runs one replicate trial.
+
+    Args:
+        rep: Replicate number; its random streams are derived from
+             params['seed'] and rep, so results do not depend on the order
+             or the process in which replicates run.
+        params: Study parameters (see STUDY_PARAMS).
+        path: Optional study directory to save the result in.
+
+    Returns:
+        A dictionary of arrays of shape (visits,): 'estimate', 'se', 'df',
+        'lower' and 'upper' pooled with EDF=inf, the same with suffix '_edf'
+        for EDF = ANCOVA residual df, 'complete' and 'complete_se' (ANCOVA
+        of the data before amputation), and the scalar 'runtime' in seconds.
+    """
+    start = time.perf_counter()
+    seeds = np.random.SeedSequence(params["seed"], spawn_key=(rep,)).generate_state(3)
+    trial = simulate_trial(params["n_subj"], seed=int(seeds[0]))
+    x, columns = trial_matrix(trial)
+    visits = columns[-len(VISITS):]
+
+    cube = two_step_impute(x, columns, nimpute=params["nimpute"], emmaxits=params["emmaxits"],
+                           maxits=params["maxits"], seed=int(seeds[1]), reg_seed=int(seeds[2]), cache_dir=None)
+    fits = ancova(cube, visits)
+    result = {}
+    for suffix, edf in (("", np.inf), ("_edf", fits["df"][0][:, None])):
+        pooled = rubin_pool(fits["estimate"], fits["se"] ** 2, edf=edf)
+        for key in ("estimate", "se", "df", "lower", "upper"):
+            result[key + suffix] = pooled[key][:, 0]
+
+    complete = create_cube(1, *x.shape, columns)
+    complete.write(0, np.column_stack([x[:, :-len(visits)], trial["CHG_COMPLETE"]]))
+    complete_fit = ancova(complete, visits)
+    result["complete"] = complete_fit["estimate"][0, :, 0]
+    result["complete_se"] = complete_fit["se"][0, :, 0]
+    result["runtime"] = time.perf_counter() - start
+
+    if path is not None:
+        tmp = _replicate_path(path, rep) + ".tmp.npz"
+        np.savez(tmp, **result)
+        os.replace(tmp, _replicate_path(path, rep))
+    return result
+
+
+def run_study(path, nrep=1000, workers=None, progress=None, **params):
+    """
+    Runs (or resumes) a simulation study in the directory path.
+
+    Args:
+        path: Study directory; holds 'study.json' with the parameters and one
+              'rep_XXXXX.npz' file per finished replicate.
+        nrep: Number of replicates.
+        workers: Number of worker processes.
+        progress: Optional callback progress(done, nrep) after each replicate.
+        params: Overrides of STUDY_PARAMS.
+
+    Returns:
+        The summary of summarize.
+    """
+    params = {**STUDY_PARAMS, **params}
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, "study.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            saved = json.load(f)["params"]
+        if saved != params:
+            raise ValueError(f"'{path}' holds a study with other parameters: {saved}")
+    with open(meta_path, "w") as f:
+        json.dump({"params": params, "nrep": nrep}, f, indent=1)
+
+    todo = [rep for rep in range(nrep) if not os.path.exists(_replicate_path(path, rep))]
+    done = nrep - len(todo)
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(run_replicate, rep, params, path) for rep in todo]):
+                future.result()
+                done += 1
+                if progress is not None:
+                    progress(done, nrep)
+    return summarize(path)
+
+
+def load_replicates(path):
+    """
+    Stacks the finished replicates of a study into arrays of shape
+    (replicates, ...), plus 'rep' with the replicate numbers.
+    """
+    files = sorted(f for f in os.listdir(path) if f.startswith("rep_") and f.endswith(".npz") and ".tmp" not in f)
+    if not files:
+        raise FileNotFoundError(f"No finished replicates in '{path}'.")
+    results = {"rep": np.array([int(f[4:9]) for f in files])}
+    for name in files:
+        with np.load(os.path.join(path, name)) as rep:
+            for key in rep.files:
+                results.setdefault(key, []).append(rep[key])
+    return {key: np.asarray(values) for key, values in results.items()}
+
+
+def summarize(path, true_effect=TRUE_EFFECT):
+    """
+    Operating characteristics of the finished replicates.
+
+    Returns:
+        A dictionary with 'nrep', 'runtime' (mean and total seconds) and
+        'by_visit': a DataFrame per visit with the bias, empirical SE, mean
+        model SE, coverage and mean CI width for EDF=inf and EDF=model df,
+        and the bias and SE of the complete-data analysis.
+    """
+    reps = load_replicates(path)
+    by_visit = {}
+    for suffix, label in (("", "inf"), ("_edf", "edf")):
+        estimate = reps["estimate" + suffix]
+        by_visit[f"bias_{label}"] = estimate.mean(axis=0) - true_effect
+        by_visit[f"emp_se_{label}"] = estimate.std(axis=0, ddof=1) if len(estimate) > 1 else np.nan
+        by_visit[f"model_se_{label}"] = reps["se" + suffix].mean(axis=0)
+        by_visit[f"coverage_{label}"] = ((reps["lower" + suffix] <= true_effect)
+                                         & (true_effect <= reps["upper" + suffix])).mean(axis=0)
+        by_visit[f"width_{label}"] = (reps["upper" + suffix] - reps["lower" + suffix]).mean(axis=0)
+    by_visit["bias_complete"] = reps["complete"].mean(axis=0) - true_effect
+    by_visit["emp_se_complete"] = reps["complete"].std(axis=0, ddof=1) if len(reps["rep"]) > 1 else np.nan
+    return {
+        "nrep": len(reps["rep"]),
+        "runtime": {"mean": float(reps["runtime"].mean()), "total": float(reps["runtime"].sum())},
+        "by_visit": pd.DataFrame(by_visit, index=pd.Index([f"WEEK{v}" for v in VISITS], name="visit")),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run or resume a simulation study.")
+    parser.add_argument("path", help="Study directory")
+    parser.add_argument("--nrep", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    for key, value in STUDY_PARAMS.items():
+        parser.add_argument(f"--{key}", type=type(value), default=value)
+    args = vars(parser.parse_args())
+    path, nrep, workers = args.pop("path"), args.pop("nrep"), args.pop("workers")
+    summary = run_study(path, nrep, workers, progress=lambda done, total: print(f"\r{done}/{total}", end=""), **args)
+    print(f"\n{summary['nrep']} replicates, {summary['runtime']['mean']:.1f} s per replicate")
+    print(summary["by_visit"].to_string())
@@ -0,0 +1,25 @@
+# conftest.py
+"""
+The app modules are imported flat, as Streamlit runs them from the
+'presentation' directory. The 'trial' fixture is a small simulated study.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+VISITS = np.arange(2, 11, 2)
+
+
+@pytest.fixture
+def trial():
+    """
+    (x, columns) of 80 simulated subjects with 5 visits, laid out like
+    analysis_matrix.
+    """
+    from simulate import simulate_trial, trial_matrix
+
+    return trial_matrix(simulate_trial(80, visits=VISITS, seed=2025), visits=VISITS)
@@ -0,0 +1,90 @@
+# test_convergence.py
+"""
+Tests of the chain monitor and the adaptive burn-in.
+"""
+import numpy as np
+import pytest
+
+from convergence import ChainMonitor
+from mcmc import adaptive_burnin, chain_rng, em_norm, mda_norm, prelim_norm
+
+
+def _monitor(traces, capacity=16):
+    """
+    A ChainMonitor fed one iteration at a time with traces of shape (C, T, K).
+    """
+    monitor = ChainMonitor([f"x{k}" for k in range(traces.shape[2])], traces.shape[0], capacity=capacity)
+    for t in range(traces.shape[1]):
+        for chain in range(traces.shape[0]):
+            monitor.update(chain, traces[chain, t])
+    return monitor
+
+
+def _split_rhat(x):
+    """
+    Split-R-hat of Gelman et al. (2013) for x of shape (C, T), computed
+    directly from the split halves.
+    """
+    h = x.shape[1] // 2
+    halves = np.concatenate([x[:, :h], x[:, x.shape[1] - h:]])
+    within = halves.var(axis=1, ddof=1).mean()
+    between = h * halves.mean(axis=1).var(ddof=1)
+    return np.sqrt(((h - 1) / h * within + between / h) / within)
+
+
+def _ar1(phi, shape, seed):
+    rng = np.random.default_rng(seed)
+    e = rng.standard_normal(shape)
+    x = np.empty(shape)
+    x[:, 0] = e[:, 0] / np.sqrt(1 - phi ** 2)
+    for t in range(1, shape[1]):
+        x[:, t] = phi * x[:, t - 1] + e[:, t]
+    return x
+
+
+def test_traces_and_window_moments_survive_growth():
+    traces = np.random.default_rng(0).normal(size=(3, 75, 2))
+    monitor = _monitor(traces, capacity=8)
+    assert monitor.niter == 75
+    np.testing.assert_array_equal(monitor.trace(), traces)
+    summary = monitor.summary(start=30)
+    np.testing.assert_allclose(summary["mean"], traces[:, 30:].mean(axis=(0, 1)))
+
+
+@pytest.mark.parametrize("stop", [40, 41, 200])
+def test_split_rhat_matches_definition(stop):
+    traces = np.random.default_rng(stop).normal(size=(4, 200, 1)) + np.arange(4)[:, None, None] * 0.1
+    monitor = _monitor(traces)
+    np.testing.assert_allclose(monitor.split_rhat(start=10, stop=stop), [_split_rhat(traces[:, 10:stop, 0])])
+
+
+def test_split_rhat_flags_separated_chains():
+    traces = np.random.default_rng(1).normal(size=(4, 400, 1))
+    assert _monitor(traces).split_rhat()[0] < 1.01
+    traces[0] += 3.0
+    assert _monitor(traces).split_rhat()[0] > 1.5
+    assert np.isnan(_monitor(traces[:, :3]).split_rhat()[0])
+
+
+def test_ess_of_independent_and_autocorrelated_draws():
+    iid = _ar1(0.0, (4, 2000), seed=2)
+    ar = _ar1(0.9, (4, 2000), seed=3)
+    ess = _monitor(np.stack([iid, ar], axis=2)).ess()
+    assert ess[0] == pytest.approx(8000, rel=0.15)
+    # The integrated autocorrelation time of an AR(1) chain is (1 + phi) / (1 - phi)
+    assert ess[1] == pytest.approx(8000 * 0.1 / 1.9, rel=0.3)
+
+
+def test_adaptive_burnin_equals_fixed_burnin(trial):
+    x, columns = trial
+    s = prelim_norm(x)
+    thetahat = em_norm(s, cache_dir=None)
+    runs = [adaptive_burnin(s, thetahat, nchains=2, seed=5, columns=columns, min_iter=10, max_iter=20,
+                            check_every=10, workers=w) for w in (1, 2)]
+    assert runs[0]["nbiter"] == runs[1]["nbiter"]
+    assert len(runs[0]["checks"]) == runs[0]["nbiter"] // 10
+    for chain in range(2):
+        np.testing.assert_array_equal(runs[0]["thetas"][chain], runs[1]["thetas"][chain])
+        fixed = mda_norm(s, thetahat, steps=runs[0]["nbiter"], rng=chain_rng(5, chain, 0))
+        np.testing.assert_array_equal(runs[0]["thetas"][chain], fixed)
+    np.testing.assert_array_equal(runs[0]["monitor"].trace(), runs[1]["monitor"].trace())
@@ -0,0 +1,59 @@
+# test_datacache.py
+"""
+Tests of the content-addressed column cache.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datacache import file_digest, load_table
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "table.csv"
+    pd.DataFrame({"SUBJID": [1, 2, 3], "AVISIT": ["WEEK2", None, "WEEK4"], "CHG": [0.5, np.nan, -1.25]}).to_csv(
+        path, index=False)
+    return str(path)
+
+
+def _entries(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name != "digests")
+
+
+def test_load_table_reads_through_cache(source, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = load_table(source, cache_dir=cache_dir)
+    again = load_table(source, columns=["CHG", "SUBJID"], cache_dir=cache_dir)
+    assert list(again.columns) == ["CHG", "SUBJID"]
+    np.testing.assert_array_equal(again["CHG"], first["CHG"])
+    assert list(first["AVISIT"]) == ["WEEK2", "", "WEEK4"]
+    assert _entries(cache_dir) == [file_digest(source, cache_dir)]
+    with open(source, "rb") as f:
+        assert file_digest(source, cache_dir) == hashlib.sha256(f.read()).hexdigest()
+    with pytest.raises(KeyError):
+        load_table(source, columns=["BASE"], cache_dir=cache_dir)
+
+
+def test_changed_source_maps_to_new_entry(source, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    load_table(source, cache_dir=cache_dir)
+    old = file_digest(source, cache_dir)
+    pd.DataFrame({"SUBJID": [1, 2], "CHG": [9.0, 8.0]}).to_csv(source, index=False)
+    changed = load_table(source, cache_dir=cache_dir)
+    assert list(changed.columns) == ["SUBJID", "CHG"]
+    np.testing.assert_array_equal(changed["CHG"], [9.0, 8.0])
+    assert file_digest(source, cache_dir) != old
+    assert len(_entries(cache_dir)) == 2
+
+
+def test_unreadable_digest_entry_is_recomputed(source, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    digest = file_digest(source, cache_dir)
+    for name in os.listdir(os.path.join(cache_dir, "digests")):
+        with open(os.path.join(cache_dir, "digests", name), "w") as f:
+            f.write("{")
+    assert file_digest(source, cache_dir) == digest
@@ -0,0 +1,89 @@
+# test_diffcheck.py
+"""
+Tests of the partitioned table diff.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from diffcheck import compare_tables
+
+
+@pytest.fixture
+def base():
+    return pd.DataFrame({
+        "SUBJID": np.repeat(np.arange(1, 6), 2),
+        "AVISIT": ["WEEK2", "WEEK4"] * 5,
+        "CHG": np.arange(10) * 0.25 - 1.0,
+        "FLAG": list("YNYNYNYNYN"),
+    })
+
+
+@pytest.mark.parametrize("nparts", [1, 4])
+def test_identical_tables_are_equal(base, nparts):
+    result = compare_tables(base, base.copy(), ["SUBJID", "AVISIT"], nparts=nparts)
+    assert result["equal"]
+    assert result["nrows"] == (10, 10)
+    assert result["summary"]["compared"].tolist() == [10, 10]
+
+
+def test_tolerances_and_offending_rows(base):
+    compare = base.copy()
+    compare.loc[0, "CHG"] += 1e-6
+    compare.loc[3, "CHG"] += 0.5
+    compare.loc[4, "FLAG"] = "N"
+    result = compare_tables(base, compare, ["SUBJID", "AVISIT"], tolerance=1e-4)
+    assert not result["equal"]
+    assert result["summary"].loc["CHG", "mismatches"] == 1
+    assert result["summary"].loc["CHG", "max_abs_diff"] == pytest.approx(0.5)
+    assert result["summary"].loc["FLAG", "mismatches"] == 1
+    rows = result["rows"].set_index("column")
+    assert (rows.loc["CHG", "SUBJID"], rows.loc["CHG", "AVISIT"]) == (2, "WEEK4")
+    assert rows.loc["FLAG", "compare"] == "N"
+
+    loose = compare_tables(base, compare, ["SUBJID", "AVISIT"], tolerance=1e-4, tolerances={"CHG": (0.0, 10.0)},
+                           columns=["CHG"])
+    assert loose["equal"]
+
+
+def test_missing_keys_and_columns(base):
+    compare = base.drop(index=[9]).drop(columns="FLAG").assign(AVAL=1.0)
+    compare.loc[20] = [6, "WEEK2", 0.0, 1.0]
+    result = compare_tables(base, compare, ["SUBJID", "AVISIT"])
+    assert not result["equal"]
+    assert result["missing"] == (1, 1)
+    assert result["base_only"] == ["FLAG"] and result["compare_only"] == ["AVAL"]
+    assert sorted(result["missing_rows"]["found_in"]) == ["base", "compare"]
+    assert result["summary"].loc["CHG", "mismatches"] == 0
+
+
+def test_duplicate_keys_are_reported_not_compared(base):
+    compare = pd.concat([base, base.iloc[[2]]], ignore_index=True)
+    compare.loc[2, "CHG"] = 99.0
+    result = compare_tables(base, compare, ["SUBJID", "AVISIT"], nparts=3)
+    assert not result["equal"]
+    assert result["duplicates"] == (0, 2)
+    assert result["missing"] == (0, 0)
+    assert result["summary"].loc["CHG", "compared"] == 9
+    assert result["duplicate_rows"][["SUBJID", "AVISIT", "base", "compare"]].values.tolist() == [[2, "WEEK2", 0, 2]]
+
+
+def test_key_type_mismatch_is_reported(base):
+    compare = base.assign(SUBJID=base["SUBJID"].astype(str))
+    result = compare_tables(base, compare, ["SUBJID", "AVISIT"])
+    assert not result["equal"]
+    assert list(result["key_dtypes"]) == ["SUBJID"]
+    assert result["summary"]["compared"].tolist() == [0, 0]
+
+
+def test_chunked_input_matches_whole_table(base, tmp_path):
+    compare = base.copy()
+    compare.loc[7, "CHG"] = 5.0
+    path = tmp_path / "compare.csv"
+    compare.to_csv(path, index=False)
+    chunks = (base.iloc[i:i + 3] for i in range(0, len(base), 3))
+    chunked = compare_tables(chunks, str(path), ["SUBJID", "AVISIT"], nparts=4)
+    whole = compare_tables(base, compare, ["SUBJID", "AVISIT"], nparts=1)
+    assert chunked["nrows"] == whole["nrows"] == (10, 10)
+    pd.testing.assert_frame_equal(chunked["summary"], whole["summary"])
+    assert chunked["rows"]["SUBJID"].tolist() == [4]
@@ -0,0 +1,72 @@
+# test_mcmc.py
+"""
+Tests of the MCMC imputation engine.
+"""
+import os
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from cube import create_cube, open_cube
+from mcmc import em_norm, mcmc_impute_chains, prelim_norm
+
+
+def test_chains_do_not_depend_on_workers(trial):
+    x, columns = trial
+    runs = [mcmc_impute_chains(x, 6, nchains=3, nbiter=5, niter=2, seed=7, workers=w, columns=columns,
+                               cache_dir=None) for w in (1, 2)]
+    np.testing.assert_array_equal(runs[0].data, runs[1].data)
+
+
+def test_resume_reuses_stored_seed(trial, tmp_path):
+    x, columns = trial
+    path = str(tmp_path / "cube")
+    full = mcmc_impute_chains(x, 4, nchains=2, nbiter=5, niter=2, workers=1, columns=columns, cache_dir=None,
+                              out=create_cube(4, *x.shape, columns, path=path))
+    expected = np.array(full.data)
+    # An interrupted run: the second chain's imputations are lost
+    full.filled[2:] = False
+    full.data[2:] = np.nan
+    full.flush()
+    resumed = mcmc_impute_chains(x, 4, nchains=2, nbiter=5, niter=2, workers=1, cache_dir=None,
+                                 out=open_cube(path))
+    np.testing.assert_array_equal(resumed.data, expected)
+    full.filled[3] = False
+    with pytest.raises(ValueError):
+        mcmc_impute_chains(x, 4, nchains=2, nbiter=5, niter=2, seed=1, workers=1, cache_dir=None,
+                           out=open_cube(path))
+
+
+def _observed_loglik(s, theta):
+    """
+    Observed-data log-likelihood of theta on the standardized scale.
+    """
+    mu, sigma = theta[0, 1:], theta[1:, 1:]
+    x = s["x"]
+    miss = np.isnan(x)
+    total = 0.0
+    for pattern in np.unique(miss, axis=0):
+        obs = ~pattern
+        if not obs.any():
+            continue
+        rows = (miss == pattern).all(axis=1)
+        total += stats.multivariate_normal(mu[obs], sigma[np.ix_(obs, obs)]).logpdf(x[rows][:, obs]).sum()
+    return total
+
+
+def test_squarem_reaches_em_likelihood(trial):
+    s = prelim_norm(trial[0])
+    plain = em_norm(s, maxits=5000, criterion=1e-8, accelerate=False, cache_dir=None)
+    fast = em_norm(s, maxits=5000, criterion=1e-8, accelerate=True, cache_dir=None)
+    assert _observed_loglik(s, fast) == pytest.approx(_observed_loglik(s, plain), abs=1e-6)
+    np.testing.assert_allclose(fast, plain, atol=1e-5)
+
+
+def test_em_estimate_is_cached(trial, tmp_path):
+    s = prelim_norm(trial[0])
+    first = em_norm(s, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    np.testing.assert_array_equal(em_norm(s, cache_dir=str(tmp_path)), first)
+    em_norm(s, accelerate=False, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,37 @@
+# test_patterns.py
+"""
+Tests of the bit-packed missing-pattern index.
+"""
+import numpy as np
+import pytest
+
+from patterns import build_pattern_index
+
+
+@pytest.mark.parametrize("p", [6, 70])
+def test_pattern_index_follows_r_ordering(p):
+    # prelim.norm.new numbers the patterns by r %*% 2^(0:(p-1)) and sorts the rows with order()
+    rng = np.random.default_rng(p)
+    x = rng.normal(size=(300, p))
+    x[rng.random((300, p)) < 0.3] = np.nan
+    x[rng.integers(300, size=120)] = x[rng.integers(300, size=120)]
+    miss = np.isnan(x)
+    mdp = [sum(1 << int(j) for j in np.flatnonzero(row)) for row in miss]
+    distinct = sorted(set(mdp))
+
+    index = build_pattern_index(x)
+    np.testing.assert_array_equal(index.pattern, [distinct.index(k) for k in mdp])
+    np.testing.assert_array_equal(index.order, sorted(range(len(mdp)), key=mdp.__getitem__))
+    np.testing.assert_array_equal(index.ro[index.order], np.arange(len(mdp)))
+    np.testing.assert_array_equal(index.nmdp, [mdp.count(k) for k in distinct])
+    np.testing.assert_array_equal(~index.r, miss[index.order[index.mdpst]])
+
+
+def test_dropout_marks_cells_after_last_observed_visit():
+    x = np.array([[1.0, np.nan, 2.0, np.nan],
+                  [np.nan, np.nan, np.nan, np.nan],
+                  [1.0, 2.0, 3.0, 4.0]])
+    index = build_pattern_index(x)
+    np.testing.assert_array_equal(index.dropout, [[False, False, False, True],
+                                                  [True, True, True, True],
+                                                  [False, False, False, False]])
@@ -0,0 +1,29 @@
+# test_pooling.py
+"""
+Tests of Rubin's rule pooling.
+"""
+import numpy as np
+
+from pooling import RubinAccumulator, rubin_pool
+
+
+def test_rubin_accumulator_matches_rubin_pool():
+    rng = np.random.default_rng(3)
+    estimates = rng.normal(size=(20, 3, 4))
+    variances = rng.gamma(2.0, 0.1, size=(20, 3, 4))
+    edf = np.arange(20, 24)
+    acc = RubinAccumulator((3, 4))
+    for estimate, variance in zip(estimates, variances):
+        acc.update(estimate, variance)
+    online, batch = acc.pooled(edf=edf), rubin_pool(estimates, variances, edf=edf)
+    assert online.keys() == batch.keys()
+    for key in batch:
+        np.testing.assert_allclose(online[key], batch[key], rtol=1e-10, err_msg=key)
+
+
+def test_accumulator_with_one_imputation_has_no_between_variance():
+    acc = RubinAccumulator(2)
+    acc.update(np.array([1.5, -1.0]), np.array([0.25, 0.04]))
+    np.testing.assert_array_equal(acc.between, [0.0, 0.0])
+    np.testing.assert_array_equal(acc.mc_error(), [0.0, 0.0])
+    np.testing.assert_allclose(acc.pooled()["se"], [0.5, 0.2])